@@ -0,0 +1,230 @@
+"""Benchmark Uroute's URL cleaning and routing hot paths.
+
+Prints results as JSON, with the time per operation in seconds, so that
+runs can be stored and compared::
+
+    $ python benchmarks/run.py --output before.json
+    $ python benchmarks/run.py --compare before.json
+
+With ``--compare``, benchmarks that got slower by more than ``--threshold``
+are reported, and the exit status is 1.
+
+``data/data.min.json`` is a snapshot of the ClearURLs rules
+(https://gitlab.com/ClearURLs/rules, LGPL-3.0), as shipped with Unalix 0.9.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES_FILE = os.path.join(BENCH_DIR, 'data', 'data.min.json')
+
+# Isolate Uroute from the user's files. This has to happen before
+# `xdg.BaseDirectory` is imported.
+TMP_DIR = tempfile.mkdtemp(prefix='uroute-bench-')
+for _name in ('CONFIG', 'DATA', 'CACHE'):
+    os.environ[f'XDG_{_name}_HOME'] = os.path.join(TMP_DIR, _name.lower())
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# pylint: disable=wrong-import-position
+import startup  # noqa: E402
+from uroute import url as u  # noqa: E402
+from uroute.__version__ import VERSION  # noqa: E402
+from uroute.core import Uroute  # noqa: E402
+
+TRACKED_URL_TEMPLATES = (
+    'https://www.amazon.{tld}/dp/B0{n:08d}/ref=sr_1_{n}'
+    '?keywords=thing&qid={n}&sr=8-1&tag=affiliate-21&pf_rd_r={n}',
+    'https://www.google.{tld}/url?sa=t&rct=j&q=&esrc=s&source=web&cd={n}'
+    '&url=https%3A%2F%2Fnews.example.org%2Fstory%2F{n}%3Futm_source%3Dgoogle'
+    '&usg=AOvVaw{n}',
+    'https://www.youtube.com/watch?v=dQw4w9WgXc{n}&feature=share&si={n}',
+    'https://www.facebook.com/story.php?story_fbid={n}&id=1&fbclid=IwAR{n}',
+    'https://l.facebook.com/l.php?u=https%3A%2F%2Fexample.com%2F{n}&h=AT{n}',
+    'https://news.example.{tld}/{n}/article.html?utm_source=newsletter'
+    '&utm_medium=email&utm_campaign=weekly-{n}',
+    'https://twitter.com/someone/status/{n}?s=20&t=abcdef{n}',
+    'https://www.ebay.{tld}/itm/{n}?hash=item{n}&_trkparms=x&_trksid=p{n}',
+)
+CLEAN_URL_TEMPLATES = (
+    'https://en.wikipedia.org/wiki/Article_{n}',
+    'https://github.com/walterl/uroute/issues/{n}',
+    'https://docs.python.org/3/library/re.html#re.{n}',
+    'https://example.{tld}/search?q=term{n}&page=2',
+)
+
+
+def make_corpus(size=2000, seed=1):
+    """Returns `size` realistic URLs, about two thirds with tracking."""
+    rnd = random.Random(seed)
+    corpus = []
+    for n in range(size):
+        templates = (
+            TRACKED_URL_TEMPLATES if rnd.random() < 0.66
+            else CLEAN_URL_TEMPLATES
+        )
+        corpus.append(rnd.choice(templates).format(
+            n=n, tld=rnd.choice(('com', 'de', 'co.uk', 'fr')),
+        ))
+    return corpus
+
+
+def make_clipboard(size, with_url=True):
+    words = ('lorem', 'ipsum', 'dolor', 'sit', 'amet,', 'consectetur')
+    rnd = random.Random(size)
+    text = ' '.join(rnd.choice(words) for _ in range(size // 6))
+    if with_url:
+        text += ' (see https://example.com/page?utm_source=x).'
+    return text
+
+
+def time_per_op(func, ops=1, repeat=5):
+    """Returns the min and median seconds per op for calling `func`,
+    which performs `ops` operations per call."""
+    timer = timeit.Timer(func)
+    number, _time_taken = timer.autorange()
+    timings = [t / number / ops for t in timer.repeat(repeat, number)]
+    return {'min_s': min(timings), 'median_s': statistics.median(timings)}
+
+
+def bench_clean_url(results):
+    rules = u.load_cleaning_rules(RULES_FILE)
+    corpus = make_corpus()
+    # Compile lazily compiled patterns before measuring
+    for corpus_url in corpus:
+        rules.clean(corpus_url)
+    results['clean_url'] = time_per_op(
+        lambda: [rules.clean(corpus_url) for corpus_url in corpus],
+        ops=len(corpus),
+    )
+
+
+def bench_load_cleaning_rules(results):
+    rules_path = os.path.join(TMP_DIR, 'rules.json')
+    cache_path = os.path.join(TMP_DIR, 'rules.cache')
+    shutil.copy(RULES_FILE, rules_path)
+
+    results['load_cleaning_rules_cold'] = time_per_op(
+        lambda: u.load_cleaning_rules(rules_path),
+    )
+    u.load_cleaning_rules(rules_path, cache_path)
+    results['load_cleaning_rules_warm'] = time_per_op(
+        lambda: u.load_cleaning_rules(rules_path, cache_path),
+    )
+
+
+def bench_extract_url(results):
+    for size in (10 * 1024, 1024 * 1024):
+        with_url = make_clipboard(size)
+        without_url = make_clipboard(size, with_url=False)
+        results[f'extract_url_{size // 1024}k'] = time_per_op(
+            lambda text=with_url: u.extract_url(text),
+        )
+        results[f'extract_url_{size // 1024}k_no_url'] = time_per_op(
+            lambda text=without_url: u.extract_url(text),
+        )
+        results[f'extract_urls_{size // 1024}k_no_url'] = time_per_op(
+            lambda text=without_url: list(u.extract_urls(text)),
+        )
+
+
+def bench_config_loading(results):
+    Uroute()  # Creates the initial configuration
+    results['uroute_init'] = time_per_op(Uroute)
+
+
+def bench_startup(results):
+    for name, result in startup.run_benchmarks(runs=5).items():
+        results[f'startup_{name}'] = result
+
+
+BENCHMARKS = {
+    'clean_url': bench_clean_url,
+    'load_cleaning_rules': bench_load_cleaning_rules,
+    'extract_url': bench_extract_url,
+    'config': bench_config_loading,
+    'startup': bench_startup,
+}
+
+
+def run_benchmarks(names):
+    results = {}
+    for name in names:
+        print(f'Running {name}...', file=sys.stderr)
+        BENCHMARKS[name](results)
+    return {
+        'uroute_version': VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Returns `(name, baseline_s, current_s)` for every benchmark that is
+    more than `threshold` (a fraction) slower than in `baseline`."""
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        if result['min_s'] > before['min_s'] * (1 + threshold):
+            regressions.append((name, before['min_s'], result['min_s']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'BENCHMARK', nargs='*',
+        help=f'Benchmarks to run: {", ".join(BENCHMARKS)}. Default: all',
+    )
+    parser.add_argument('--output', '-o', help='Write results to this file.')
+    parser.add_argument(
+        '--compare', help='Compare with results from an earlier run.',
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='Slowdown ratio reported as a regression. Default: 0.2',
+    )
+    options = parser.parse_args()
+    for name in options.BENCHMARK:
+        if name not in BENCHMARKS:
+            parser.error(f'Unknown benchmark: {name}')
+
+    try:
+        results = run_benchmarks(options.BENCHMARK or list(BENCHMARKS))
+    finally:
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if options.output:
+        with open(options.output, 'w', encoding='UTF-8') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+    if options.compare:
+        with open(options.compare, encoding='UTF-8') as baseline_file:
+            regressions = compare(
+                json.load(baseline_file), results, options.threshold,
+            )
+        for name, before, after in regressions:
+            print(
+                f'REGRESSION {name}: {before:.3g}s -> {after:.3g}s',
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark Uroute's process startup time.
+
+Runs ``uroute --version`` and a headless ``uroute clean`` in fresh Python
+processes, with XDG directories pointing to a temporary directory, and
+prints the timings as JSON. Each benchmark also reports whether GTK
+(``gi``) was imported, which is the main cost of starting the GUI.
+
+Usage::
+
+    $ python benchmarks/startup.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RULES = {'providers': {'globalRules': {
+    'urlPattern': '.*',
+    'rules': ['utm_[a-z]+', 'fbclid'],
+}}}
+URLS = '\n'.join(
+    f'https://example.com/{i}?utm_source=news&id={i}' for i in range(100)
+)
+
+BENCHMARKS = {
+    'version': (['--version'], None),
+    'clean': (['clean'], URLS),
+}
+
+
+def create_environment(tmp_dir):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, (REPO_DIR, env.get('PYTHONPATH'))),
+    )
+    for name in ('CONFIG', 'DATA', 'CACHE'):
+        env[f'XDG_{name}_HOME'] = os.path.join(tmp_dir, name.lower())
+
+    rules_dir = os.path.join(env['XDG_DATA_HOME'], 'uroute')
+    os.makedirs(rules_dir)
+    rules_path = os.path.join(rules_dir, 'rules.json')
+    with open(rules_path, 'w', encoding='UTF-8') as rules_file:
+        json.dump(RULES, rules_file)
+    return env
+
+
+def run_uroute(args, stdin, env, importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-m', 'uroute', *args]
+    start = time.perf_counter()
+    proc = subprocess.run(
+        cmd, input=stdin, env=env, universal_newlines=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+    )
+    return time.perf_counter() - start, proc.stderr
+
+
+def imports_gtk(args, stdin, env):
+    _duration, stderr = run_uroute(args, stdin, env, importtime=True)
+    return any(
+        line.rsplit('|', 1)[-1].strip() == 'gi'
+        for line in stderr.splitlines()
+    )
+
+
+def run_benchmarks(runs):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = create_environment(tmp_dir)
+        for name, (args, stdin) in BENCHMARKS.items():
+            # Warm up: creates the initial config and rules cache
+            run_uroute(args, stdin, env)
+            timings = [run_uroute(args, stdin, env)[0] for _ in range(runs)]
+            results[name] = {
+                'command': ' '.join(['uroute', *args]),
+                'runs': runs,
+                'min_s': min(timings),
+                'median_s': statistics.median(timings),
+                'imports_gtk': imports_gtk(args, stdin, env),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    options = parser.parse_args()
+    json.dump(run_benchmarks(options.runs), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import io
+import unittest
+
+from uroute import batch, url
+
+
+class TestCleanLines(unittest.TestCase):
+    rules = url.CompiledRules({'providers': {'example': {
+        'urlPattern': '^https?:\\/\\/example\\.com',
+        'rules': ['utm_[a-z]+'],
+    }}})
+    lines = [
+        f'https://example.com/{i}?utm_source=x&id={i}' if i % 7 else ''
+        for i in range(100)
+    ]
+    expected = [
+        f'https://example.com/{i}?id={i}' if i % 7 else ''
+        for i in range(100)
+    ]
+
+    def test_clean_lines(self):
+        self.assertEqual(
+            list(batch.clean_lines(self.rules.clean, self.lines)),
+            self.expected,
+        )
+
+    def test_clean_lines_parallel_keeps_order(self):
+        self.assertEqual(
+            list(batch.clean_lines_parallel(
+                self.rules, iter(self.lines), jobs=2, chunk_size=3,
+            )),
+            self.expected,
+        )
+
+    def test_extract_lines(self):
+        lines = ['Read https://example.com/1 and', '', 'https://a.org/.']
+        self.assertEqual(
+            list(batch.extract_lines(lines)),
+            ['https://example.com/1', 'https://a.org/'],
+        )
+
+    def test_write_lines(self):
+        out = io.StringIO()
+        self.assertEqual(batch.write_lines(iter(['a', 'b', 'c']), out, 2), 3)
+        self.assertEqual(out.getvalue(), 'a\nb\nc\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from uroute.cache import LruCache
+
+
+class TestLruCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LruCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'test.cache')
+            cache = LruCache()
+            cache.put(('fingerprint', 'url'), 'cleaned')
+            cache.save(path)
+
+            loaded = LruCache()
+            loaded.load(path)
+            self.assertEqual(loaded.get(('fingerprint', 'url')), 'cleaned')
+            self.assertFalse(loaded.modified)
+
+            with mock.patch('uroute.cache.VERSION', 'other'):
+                ignored = LruCache()
+                ignored.load(path)
+            self.assertEqual(len(ignored), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
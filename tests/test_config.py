@@ -0,0 +1,164 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from uroute import config as uroute_config
+from uroute.config import Config
+
+CONFIG = """\
+[main]
+default_program = firefox
+
+[program:firefox]
+name = Firefox
+command = firefox --x=100%%
+"""
+
+
+class TestConfigSnapshot(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self._tmp_dir.name, 'uroute.ini')
+        self.snapshot_path = os.path.join(self._tmp_dir.name, 'snapshot')
+        self.write_config(CONFIG)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def write_config(self, content):
+        with open(self.config_path, 'w', encoding='UTF-8') as config_file:
+            config_file.write(content)
+
+    def load_config(self):
+        return Config(self.config_path, snapshot_path=self.snapshot_path)
+
+    def test_snapshot_skips_parsing(self):
+        config = self.load_config()
+        self.assertEqual(config.derive('name', lambda: 'derived'), 'derived')
+        config.save_snapshot()
+
+        build = mock.Mock()
+        with mock.patch.object(Config, 'read_string') as read_string:
+            config = self.load_config()
+            read_string.assert_not_called()
+        self.assertEqual(config.derive('name', build), 'derived')
+        build.assert_not_called()
+        self.assertEqual(config['main']['default_program'], 'firefox')
+        self.assertEqual(
+            config['program:firefox']['command'], 'firefox --x=100%',
+        )
+
+    def test_changed_config_is_parsed(self):
+        config = self.load_config()
+        config.derive('name', lambda: 'old')
+        config.save_snapshot()
+
+        self.write_config(CONFIG.replace('Firefox', 'Firefox ESR'))
+        os.utime(self.config_path, ns=(0, 0))
+        config = self.load_config()
+        self.assertEqual(config['program:firefox']['name'], 'Firefox ESR')
+        self.assertEqual(config.derive('name', lambda: 'new'), 'new')
+
+    def test_unreadable_snapshot_is_ignored(self):
+        with open(self.snapshot_path, 'wb') as snapshot_file:
+            snapshot_file.write(b'garbage')
+        config = self.load_config()
+        self.assertEqual(config['main']['default_program'], 'firefox')
+        config.save_snapshot()
+        self.assertEqual(
+            self.load_config()['main']['default_program'], 'firefox',
+        )
+
+
+class TestConfigWrites(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self._tmp_dir.name, 'uroute.ini')
+        with open(self.config_path, 'w', encoding='UTF-8') as config_file:
+            config_file.write(CONFIG)
+        self.config = Config(
+            self.config_path,
+            snapshot_path=os.path.join(self._tmp_dir.name, 'snapshot'),
+        )
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def read_back(self):
+        return Config(
+            self.config_path,
+            snapshot_path=os.path.join(self._tmp_dir.name, 'snapshot2'),
+        )
+
+    def test_write_setting(self):
+        self.config.write_bool('ask_default_browser', False)
+        self.assertFalse(self.read_back().read_bool('ask_default_browser'))
+
+    def test_transaction_writes_once(self):
+        with mock.patch.object(
+                uroute_config, '_write_atomic',
+                wraps=uroute_config._write_atomic) as write_atomic:
+            with self.config.transaction():
+                self.config.write_bool('ask_default_browser', 'no')
+                with self.config.transaction():
+                    self.config.write_setting('default_program', 'chromium')
+                write_atomic.assert_not_called()
+            write_atomic.assert_called_once()
+
+        config = self.read_back()
+        self.assertFalse(config.read_bool('ask_default_browser'))
+        self.assertEqual(config['main']['default_program'], 'chromium')
+
+    def test_transaction_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with self.config.transaction():
+                self.config.write_setting('default_program', 'chromium')
+                self.config.write_setting('new_setting', 'yes')
+                raise RuntimeError()
+
+        self.assertEqual(self.config['main']['default_program'], 'firefox')
+        self.assertNotIn('new_setting', self.config['main'])
+        self.assertEqual(
+            self.read_back()['main']['default_program'], 'firefox',
+        )
+
+    def test_keeps_external_edits(self):
+        with open(self.config_path, 'a', encoding='UTF-8') as config_file:
+            config_file.write('\n[program:lynx]\nname = Lynx\n'
+                              'command = lynx\n')
+        self.config.write_bool('ask_default_browser', 'no')
+
+        config = self.read_back()
+        self.assertEqual(config['program:lynx']['command'], 'lynx')
+        self.assertEqual(
+            config['program:firefox']['command'], 'firefox --x=100%',
+        )
+        self.assertFalse(config.read_bool('ask_default_browser'))
+
+    def test_unparsable_file_is_not_overwritten(self):
+        with open(self.config_path, 'w', encoding='UTF-8') as config_file:
+            config_file.write('[main\nbroken')
+        self.config.write_bool('ask_default_browser', 'no')
+        with open(self.config_path, encoding='UTF-8') as config_file:
+            self.assertEqual(config_file.read(), '[main\nbroken')
+
+    def test_background_write(self):
+        with mock.patch.object(uroute_config.threading, 'Thread') as thread:
+            self.config.write_bool(
+                'ask_default_browser', 'no', background=True,
+            )
+        target = thread.call_args[1]['target']
+        args = thread.call_args[1]['args']
+        thread.return_value.start.assert_called_once()
+        self.assertTrue(target(*args))
+        self.assertFalse(self.read_back().read_bool('ask_default_browser'))
+
+    def test_read_bool_does_not_modify_config(self):
+        self.config['main']['ask_default_browser'] = 'maybe'
+        self.assertTrue(self.config.read_bool('ask_default_browser'))
+        self.assertEqual(self.config['main']['ask_default_browser'], 'maybe')
+
+
+if __name__ == '__main__':
+    unittest.main()
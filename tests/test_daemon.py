@@ -0,0 +1,155 @@
+import os
+import queue
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from uroute import daemon
+
+
+class TestDaemonProtocol(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.socket_path = os.path.join(tmp_dir.name, 'uroute.sock')
+
+    def test_send_url_without_daemon(self):
+        self.assertFalse(
+            daemon.send_url('https://x.org/', socket_path=self.socket_path),
+        )
+
+    def test_send_url(self):
+        requests = []
+        sock = daemon.bind_socket(self.socket_path)
+        self.addCleanup(sock.close)
+
+        def serve():
+            conn, _address = sock.accept()
+            with conn:
+                requests.append(daemon.read_request(conn))
+                conn.sendall(b'ok\n')
+
+        server = threading.Thread(target=serve)
+        server.start()
+        self.assertTrue(
+            daemon.send_url(
+                'https://x.org/', 'firefox', socket_path=self.socket_path,
+            ),
+        )
+        server.join()
+        self.assertEqual(requests, [('https://x.org/', 'firefox', False)])
+
+    def test_bind_socket_refuses_second_daemon(self):
+        sock = daemon.bind_socket(self.socket_path)
+        self.addCleanup(sock.close)
+        with self.assertRaises(RuntimeError):
+            daemon.bind_socket(self.socket_path)
+
+    def test_bind_socket_replaces_stale_socket(self):
+        daemon.bind_socket(self.socket_path).close()
+        self.assertTrue(os.path.exists(self.socket_path))
+        daemon.bind_socket(self.socket_path).close()
+
+
+
+class TestDaemonConnection(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.daemon = daemon.Daemon(os.path.join(tmp_dir.name, 'uroute.sock'))
+        self.daemon.sock = daemon.bind_socket(self.daemon.socket_path)
+        self.addCleanup(self.daemon.sock.close)
+        self.gui = self.daemon.gui = mock.Mock()
+        # Unchanged, as missing
+        self.gui.uroute.config.filename = os.path.join(
+            tmp_dir.name, 'uroute.ini',
+        )
+
+        # Calls posted to the main loop
+        self.idle_calls = queue.Queue()
+        gui_module = mock.Mock()
+        gui_module.GLib.idle_add.side_effect = (
+            lambda func, *args: self.idle_calls.put((func, args))
+        )
+        patcher = mock.patch.dict(sys.modules, {'uroute.gui': gui_module})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_idle_call(self):
+        func, args = self.idle_calls.get(timeout=5)
+        return func(*args)
+
+    def handle(self, url):
+        client = threading.Thread(
+            target=daemon.send_url,
+            args=(url,), kwargs={'socket_path': self.daemon.socket_path},
+        )
+        client.start()
+        try:
+            return self.daemon._on_connection(None, None)
+        finally:
+            client.join()
+
+    def test_keeps_watching_after_error(self):
+        self.gui.present_url.side_effect = RuntimeError('GTK')
+        with self.assertLogs(daemon.log, 'ERROR'):
+            self.assertTrue(self.handle(None))
+
+    def test_routes_in_background(self):
+        route_started = threading.Event()
+        unblock = threading.Event()
+
+        def route_url(url):
+            route_started.set()
+            unblock.wait(5)
+            return 'firefox', url
+
+        self.gui.uroute.route_url.side_effect = route_url
+        self.assertTrue(self.handle('https://x.org/'))
+        self.assertTrue(route_started.wait(5))
+        self.gui.uroute.run.assert_not_called()
+
+        unblock.set()
+        self.assertFalse(self.run_idle_call())
+        self.gui.uroute.run.assert_called_once_with(
+            'firefox', 'https://x.org/', wait=False,
+        )
+
+    def test_routing_error_shows_window(self):
+        self.gui.uroute.route_url.side_effect = FileNotFoundError('prog')
+        with self.assertLogs(daemon.log, 'ERROR'):
+            self.assertTrue(self.handle('https://x.org/'))
+            self.run_idle_call()
+        self.gui.present_url.assert_called_once_with('https://x.org/', None)
+
+    def test_keeps_gui_if_reload_fails(self):
+        self.daemon.config_mtime = 1
+        self.gui.uroute.route_url.return_value = None
+        with mock.patch.object(
+                self.daemon, '_get_config_mtime', return_value=2,
+        ), mock.patch.object(
+                self.daemon, '_load', side_effect=KeyError('name'),
+        ), self.assertLogs(daemon.log, 'ERROR'):
+            self.assertTrue(self.handle('https://x.org/'))
+        self.run_idle_call()
+        self.assertIs(self.daemon.gui, self.gui)
+        self.gui.present_url.assert_called_once_with('https://x.org/', None)
+
+    def test_reload_closes_replaced_instance(self):
+        old_uroute = self.gui.uroute
+        gui_module = mock.Mock()
+        with mock.patch.dict(sys.modules, {'uroute.gui': gui_module}), \
+                mock.patch('uroute.core.Uroute') as uroute_class:
+            self.daemon._load()
+        old_uroute.save_caches.assert_called_once_with()
+        old_uroute.close.assert_called_once_with()
+        self.gui.destroy.assert_called_once_with()
+        gui_module.UrouteGui.assert_called_once_with(
+            uroute_class.return_value, resident=True,
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
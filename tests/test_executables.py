@@ -0,0 +1,95 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from uroute.executables import ExecutableCache
+
+
+def make_executable(path):
+    with open(path, 'w', encoding='UTF-8') as exe_file:
+        exe_file.write('#!/bin/sh\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+
+class TestExecutableCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_dir = self._tmp_dir.name
+        self.bin_dirs = [
+            os.path.join(self.tmp_dir, name) for name in ('bin1', 'bin2')
+        ]
+        for bin_dir in self.bin_dirs:
+            os.mkdir(bin_dir)
+        self.cache = ExecutableCache(os.pathsep.join(self.bin_dirs))
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_resolve(self):
+        exe_path = os.path.join(self.bin_dirs[1], 'browser')
+        make_executable(exe_path)
+        self.assertEqual(self.cache.resolve('browser'), exe_path)
+        self.assertIsNone(self.cache.resolve('missing'))
+
+    def test_path_order(self):
+        for bin_dir in self.bin_dirs:
+            make_executable(os.path.join(bin_dir, 'browser'))
+        self.assertEqual(
+            self.cache.resolve('browser'),
+            os.path.join(self.bin_dirs[0], 'browser'),
+        )
+
+    def test_non_executable_ignored(self):
+        with open(
+            os.path.join(self.bin_dirs[0], 'browser'), 'w', encoding='UTF-8',
+        ) as file:
+            file.write('')
+        self.assertIsNone(self.cache.resolve('browser'))
+
+    def test_absolute_path(self):
+        exe_path = os.path.join(self.bin_dirs[0], 'browser')
+        make_executable(exe_path)
+        self.assertEqual(self.cache.resolve(exe_path), exe_path)
+        self.assertIsNone(self.cache.resolve(exe_path + '-missing'))
+
+    def test_invalidated_by_new_executable(self):
+        self.assertIsNone(self.cache.resolve('browser'))
+        exe_path = os.path.join(self.bin_dirs[1], 'browser')
+        make_executable(exe_path)
+        # Make sure the directory mtime differs from the one stamped
+        os.utime(self.bin_dirs[1], ns=(0, 0))
+        self.assertEqual(self.cache.resolve('browser'), exe_path)
+
+    def test_invalidated_by_removed_executable(self):
+        exe_path = os.path.join(self.bin_dirs[0], 'browser')
+        make_executable(exe_path)
+        self.assertEqual(self.cache.resolve('browser'), exe_path)
+        os.remove(exe_path)
+        self.assertIsNone(self.cache.resolve('browser'))
+
+    def test_save_and_load(self):
+        exe_path = os.path.join(self.bin_dirs[0], 'browser')
+        make_executable(exe_path)
+        cache_path = os.path.join(self.tmp_dir, 'executables.cache')
+        self.cache.resolve('browser')
+        self.cache.save(cache_path)
+
+        cache = ExecutableCache(self.cache.path_env)
+        cache.load(cache_path)
+        self.assertEqual(cache.resolve('browser'), exe_path)
+        self.assertFalse(cache.modified)
+
+    def test_load_ignores_other_path(self):
+        make_executable(os.path.join(self.bin_dirs[0], 'browser'))
+        cache_path = os.path.join(self.tmp_dir, 'executables.cache')
+        self.cache.resolve('browser')
+        self.cache.save(cache_path)
+
+        cache = ExecutableCache(self.bin_dirs[1])
+        cache.load(cache_path)
+        self.assertIsNone(cache.resolve('browser'))
+
+
+if __name__ == '__main__':
+    unittest.main()
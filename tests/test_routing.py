@@ -0,0 +1,81 @@
+import unittest
+
+from uroute.routing import HostTrie, Route, Router
+
+
+class TestHostTrie(unittest.TestCase):
+    def test_lookup(self):
+        trie = HostTrie()
+        trie.add('example.com', 0)
+        trie.add('*.example.com', 1)
+        trie.add('*.deep.example.com', 2)
+
+        self.assertEqual(trie.lookup('example.com'), [0])
+        self.assertEqual(trie.lookup('WWW.Example.com.'), [1])
+        self.assertEqual(trie.lookup('a.deep.example.com'), [1, 2])
+        self.assertEqual(trie.lookup('deep.example.com'), [1])
+        self.assertEqual(trie.lookup('notexample.com'), [])
+
+
+class TestRouter(unittest.TestCase):
+    router = Router([
+        Route('work', 'chromium', ['*.corp.example', 'intra*.example.org'],
+              [], []),
+        Route('tor', 'tor-browser', [], [r'^https?://[a-z2-7]{56}\.onion'],
+              []),
+        Route('mail', 'thunderbird', ['corp.example'], [], ['mailto']),
+        Route('any', 'firefox', [], ['(?P<x>https)://'], []),
+    ])
+
+    def route(self, url):
+        route = self.router.route(url)
+        return route and route.name
+
+    def test_route(self):
+        for url, expected in (
+            ('https://jira.corp.example/browse/X-1', 'work'),
+            ('http://intranet.example.org:8080/', 'work'),
+            ('https://intranet.example.org.evil.com/', 'any'),
+            ('http://' + 'a' * 56 + '.onion/', 'tor'),
+            ('https://corp.example/', 'mail'),
+            ('mailto:someone@example.com', 'mail'),
+            ('https://jira.corp.example.evil.com/', 'any'),
+            ('http://example.com/', None),
+            ('not a url', None),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.route(url), expected)
+
+    def test_first_configured_route_wins(self):
+        router = Router([
+            Route('regex', 'a', [], ['https://www\\.'], []),
+            Route('host', 'b', ['www.example.com'], [], []),
+        ])
+        self.assertEqual(
+            router.route('https://www.example.com/').name, 'regex',
+        )
+
+    def test_uncombinable_regexes(self):
+        router = Router([
+            Route('a', 'a', [], ['(?P<x>a)://'], []),
+            Route('b', 'b', [], ['(?P<x>b)://'], []),
+        ])
+        self.assertEqual(router.route('b://x').name, 'b')
+
+    def test_backreferences(self):
+        router = Router([
+            Route('a', 'A', ['intra*.example.com'], [], []),
+            Route('b', 'B', [], [r'^https://(\w+)\.\1/'], []),
+            Route('c', 'C', [], [r'^https://(?P<x>\w+)-(?P=x)\.'], []),
+            Route('d', 'D', [], ['^https://'], []),
+        ])
+        self.assertEqual(router.route('https://foo.foo/').name, 'b')
+        self.assertEqual(router.route('https://x-x.org/').name, 'c')
+        self.assertEqual(router.route('https://foo.bar/').name, 'd')
+        self.assertEqual(
+            router.route('https://intranet.example.com/').name, 'a',
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
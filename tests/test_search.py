@@ -0,0 +1,59 @@
+import unittest
+
+from uroute.core import Program
+from uroute.search import ProgramIndex, fuzzy_match
+
+
+class TestFuzzyMatch(unittest.TestCase):
+    def test_fuzzy_match(self):
+        self.assertTrue(fuzzy_match('fox', 'firefox'))
+        self.assertTrue(fuzzy_match('ffp', 'firefox private'))
+        self.assertTrue(fuzzy_match('', 'firefox'))
+        self.assertFalse(fuzzy_match('xof', 'firefox'))
+        self.assertFalse(fuzzy_match('chrome', 'chromium'))
+
+
+class TestProgramIndex(unittest.TestCase):
+    programs = {
+        'firefox': Program('Firefox', 'firefox', None),
+        'firefox-private': Program('Firefox: Private', 'firefox -p', None),
+        'chromium-work': Program('Chromium Work', 'chromium', None),
+        'tor': Program('Tor Browser', 'tor-browser', None),
+    }
+
+    def setUp(self):
+        self.index = ProgramIndex(self.programs)
+
+    def test_search(self):
+        self.assertEqual(self.index.search(''), set(self.programs))
+        self.assertEqual(
+            self.index.search('FIRE'), {'firefox', 'firefox-private'},
+        )
+        self.assertEqual(self.index.search('fire priv'), {'firefox-private'})
+        self.assertEqual(self.index.search('crwk'), {'chromium-work'})
+        self.assertEqual(self.index.search('browser'), {'tor'})
+        self.assertEqual(self.index.search('safari'), set())
+
+    def test_incremental_search(self):
+        results = [
+            self.index.search(query)
+            for query in ('f', 'fi', 'fir', 'fire ', 'fire p', 'fire', 'r')
+        ]
+        self.assertEqual(results, [
+            {'firefox', 'firefox-private'},
+            {'firefox', 'firefox-private'},
+            {'firefox', 'firefox-private'},
+            {'firefox', 'firefox-private'},
+            {'firefox-private'},
+            {'firefox', 'firefox-private'},
+            {'firefox', 'firefox-private', 'chromium-work', 'tor'},
+        ])
+        self.assertEqual(self.index.matches, results[-1])
+
+    def test_unchanged_query_returns_same_matches(self):
+        matches = self.index.search('fire')
+        self.assertIs(self.index.search(' fire '), matches)
+
+
+if __name__ == '__main__':
+    unittest.main()
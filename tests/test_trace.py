@@ -0,0 +1,80 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from unittest import mock
+
+from uroute import trace
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.trace_path = os.path.join(self._tmp_dir.name, 'trace.json')
+        self.profile_path = os.path.join(self._tmp_dir.name, 'profile')
+        patcher = mock.patch.multiple(
+            trace, _tracer=None, _profiler=None, _profile_path=None,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Don't save at exit
+        atexit_patcher = mock.patch.object(trace.atexit, 'register')
+        atexit_patcher.start()
+        self.addCleanup(atexit_patcher.stop)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_disabled(self):
+        @trace.traced()
+        def add(a, b):
+            return a + b
+
+        with trace.span('nothing'):
+            self.assertEqual(add(1, 2), 3)
+        trace.mark('nothing')
+        self.assertFalse(trace.enabled())
+
+    def test_trace(self):
+        trace.enable(self.trace_path)
+
+        @trace.traced()
+        def fails():
+            raise ValueError()
+
+        with trace.span('outer', size=2):
+            with self.assertRaises(ValueError):
+                fails()
+        trace.mark('done')
+        trace._tracer.save()  # pylint: disable=protected-access
+
+        with open(self.trace_path, encoding='UTF-8') as trace_file:
+            events = json.load(trace_file)['traceEvents']
+        by_name = {event['name']: event for event in events}
+
+        inner = by_name['TestTrace.test_trace.<locals>.fails']
+        outer = by_name['outer']
+        self.assertEqual(outer['ph'], 'X')
+        self.assertEqual(outer['args'], {'size': 2})
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(
+            outer['ts'] + outer['dur'], inner['ts'] + inner['dur'],
+        )
+        self.assertEqual(by_name['done']['ph'], 'i')
+
+    def test_enabled_by_environment(self):
+        with mock.patch.dict(os.environ, {trace.ENV_TRACE: self.trace_path}):
+            trace.enable()
+        self.assertTrue(trace.enabled())
+
+    def test_profile(self):
+        trace.enable(profile_path=self.profile_path)
+        sum(range(1000))
+        trace.stop_profile()
+        trace.stop_profile()  # No-op
+        self.assertTrue(pstats.Stats(self.profile_path).total_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
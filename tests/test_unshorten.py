@@ -0,0 +1,124 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from uroute.unshorten import Unshortener
+
+REDIRECTS = {
+    '/short': '/shorter?utm_source=x',
+    '/shorter': 'https://example.com/target?utm_source=x',
+    '/loop': '/loop',
+}
+ERRORS = {'/unavailable': 503, '/no-head': 405, '/gone': 404}
+
+
+class ShortenerHandler(BaseHTTPRequestHandler):
+    """Redirects according to `REDIRECTS`, over keep-alive connections."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        self.server.requests.append(self.path)
+        if self.path == '/slow':
+            time.sleep(0.5)
+        location = REDIRECTS.get(self.path.split('?')[0])
+        self.send_response(
+            301 if location else ERRORS.get(self.path, 200),
+        )
+        if location:
+            self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *_args):  # pylint: disable=arguments-differ
+        pass
+
+
+def strip_utm(url):
+    return url.replace('?utm_source=x', '')
+
+
+class TestUnshortener(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ShortenerHandler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.requests = []
+        thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={'poll_interval': 0.01},
+        )
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+        self.unshortener = Unshortener(hosts=['127.0.0.1'], timeout=0.2)
+        self.addCleanup(self.unshortener.close)
+
+    def test_follows_and_cleans_redirects(self):
+        self.assertEqual(
+            self.unshortener.resolve_sync(
+                self.base_url + '/short', clean=strip_utm,
+            ),
+            'https://example.com/target',
+        )
+        # Cleaned before being followed
+        self.assertEqual(self.server.requests, ['/short', '/shorter'])
+
+    def test_reuses_connections(self):
+        urls = [self.base_url + '/short', self.base_url + '/other'] * 3
+        resolved = self.unshortener.run(self.unshortener.resolve_many(urls))
+        self.assertEqual(resolved[1], self.base_url + '/other')
+        self.assertEqual(
+            resolved[0], 'https://example.com/target?utm_source=x',
+        )
+        self.assertLess(self.server.connections, len(self.server.requests))
+
+    def test_caches_redirects(self):
+        self.unshortener.resolve_sync(self.base_url + '/short')
+        requests = len(self.server.requests)
+        self.unshortener.resolve_sync(self.base_url + '/short')
+        self.assertEqual(len(self.server.requests), requests)
+
+        self.unshortener.ttl = 0
+        self.unshortener.resolve_sync(self.base_url + '/short')
+        self.assertGreater(len(self.server.requests), requests)
+
+    def test_caches_final_responses_only(self):
+        for path, cached in (
+            ('/other', True), ('/gone', True),
+            ('/unavailable', False), ('/no-head', False),
+        ):
+            with self.subTest(path=path):
+                url = self.base_url + path
+                self.assertEqual(self.unshortener.resolve_sync(url), url)
+                requests = len(self.server.requests)
+                self.unshortener.resolve_sync(url)
+                self.assertEqual(
+                    len(self.server.requests), requests + (not cached),
+                )
+
+    def test_timeout_budget(self):
+        url = self.base_url + '/slow'
+        start = time.monotonic()
+        self.assertEqual(self.unshortener.resolve_sync(url), url)
+        self.assertLess(time.monotonic() - start, 0.45)
+
+    def test_redirect_loop(self):
+        url = self.base_url + '/loop'
+        self.assertEqual(self.unshortener.resolve_sync(url), url)
+
+    def test_ignores_other_hosts(self):
+        url = 'https://example.com/short'
+        self.assertEqual(self.unshortener.resolve_sync(url), url)
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
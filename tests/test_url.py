@@ -1,9 +1,55 @@
+import json
+import os
+import pickle
+import tempfile
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.error import HTTPError
+from unittest import mock
 from urllib.parse import quote
 
 from uroute import url
 
 
+class TestExtractUrls(unittest.TestCase):
+    def test_extract_urls(self):
+        text = (
+            'See https://example.com/a?b=c&d=e, and '
+            '(https://example.org/x). Also <https://example.net/y>, '
+            '"https://example.com/q" and '
+            'https://en.wikipedia.org/wiki/Python_(programming_language)!'
+        )
+        self.assertEqual(list(url.extract_urls(text)), [
+            'https://example.com/a?b=c&d=e',
+            'https://example.org/x',
+            'https://example.net/y',
+            'https://example.com/q',
+            'https://en.wikipedia.org/wiki/Python_(programming_language)',
+        ])
+
+    def test_trailing_punctuation(self):
+        for text, expected in (
+            ('https://example.com/.', 'https://example.com/'),
+            ('https://example.com/a...', 'https://example.com/a'),
+            ('[https://example.com/a]', 'https://example.com/a'),
+            ('https://example.com/a_[1];', 'https://example.com/a_[1]'),
+            ("'http://example.com/a'", 'http://example.com/a'),
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(url.extract_url(text), expected)
+
+    def test_no_urls(self):
+        self.assertEqual(
+            list(url.extract_urls('https:// ftp://x.org xhttps://x.org')), [],
+        )
+        self.assertIsNone(url.extract_url('nothing here'))
+
+    def test_lazy(self):
+        urls = url.extract_urls('https://a.org ' * 100000)
+        self.assertEqual(next(urls), 'https://a.org')
+
+
 class TestCleanUrl(unittest.TestCase):
     rules = {'providers': {'dummy provider': {
         'urlPattern': '^',
@@ -29,5 +75,444 @@ class TestCleanUrl(unittest.TestCase):
         )
 
 
+class TestRedirects(unittest.TestCase):
+    rules_data = {'providers': {'redirector': {
+        'urlPattern': '^https?:\\/\\/r\\.to',
+        'redirections': ['^https?:\\/\\/r\\.to\\/\\?u=(.+)$'],
+        'rules': ['utm_[a-z]+'],
+    }}}
+
+    def setUp(self):
+        self.rules = url.CompiledRules(self.rules_data)
+
+    def test_deeply_nested_redirects(self):
+        nested = 'https://r.to/?u=' * 2000 + 'https://ddg.co/'
+        self.assertEqual(
+            self.rules.clean(nested),
+            'https://r.to/?u=' * (2000 - 10) + 'https://ddg.co/',
+        )
+        self.assertEqual(
+            self.rules.clean(nested, max_redirects=2000), 'https://ddg.co/',
+        )
+
+    def test_max_redirects_attribute(self):
+        self.rules.max_redirects = 2
+        nested = 'https://r.to/?u=' * 3 + 'https://ddg.co/'
+        self.assertEqual(
+            self.rules.clean(nested), 'https://r.to/?u=https://ddg.co/',
+        )
+
+    def test_redirect_target_is_cleaned(self):
+        self.assertEqual(
+            self.rules.clean(
+                'https://r.to/?u=https://r.to/?u=https%3A%2F%2Fr.to%2Fp%3F'
+                'utm_source%3Dx%26id%3D1',
+            ),
+            'https://r.to/p?id=1',
+        )
+
+    def test_chain_of_max_redirects(self):
+        nested = (
+            'https://r.to/?u=https://r.to/?u=https%3A%2F%2Fr.to%2Fp%3F'
+            'utm_source%3Dx%26id%3D1'
+        )
+        self.assertEqual(
+            self.rules.clean(nested, max_redirects=2), 'https://r.to/p?id=1',
+        )
+        self.assertEqual(
+            self.rules.clean(nested, max_redirects=1),
+            'https://r.to/?u=https://r.to/p?utm_source=x&id=1',
+        )
+
+    def test_redirect_loop(self):
+        class LoopingRules(url.CompiledRules):
+            redirects = {'https://a.to/': 'https://b.to/',
+                         'https://b.to/': 'https://c.to/',
+                         'https://c.to/': 'https://a.to/'}
+
+            def _clean_once(self, url):
+                return url, self.redirects.get(url)
+
+        rules = LoopingRules()
+        self.assertEqual(rules.clean('https://a.to/'), 'https://a.to/')
+        self.assertEqual(rules.clean('https://b.to/'), 'https://b.to/')
+
+    def test_chain_ends_are_memoized(self):
+        tail = 'https://r.to/?u=' * 5 + 'https://ddg.co/'
+        with mock.patch.object(
+                self.rules, '_clean_once',
+                wraps=self.rules._clean_once) as clean_once:
+            self.assertEqual(self.rules.clean(tail), 'https://ddg.co/')
+            self.assertEqual(clean_once.call_count, 6)
+            clean_once.reset_mock()
+
+            self.assertEqual(
+                self.rules.clean('https://r.to/?u=' + tail),
+                'https://ddg.co/',
+            )
+            self.assertEqual(clean_once.call_count, 1)
+
+    def test_memo_respects_max_redirects(self):
+        nested = 'https://r.to/?u=' * 3 + 'https://ddg.co/'
+        self.assertEqual(self.rules.clean(nested), 'https://ddg.co/')
+        self.assertEqual(
+            self.rules.clean(nested, max_redirects=2),
+            'https://r.to/?u=https://ddg.co/',
+        )
+        self.assertEqual(
+            self.rules.clean('https://r.to/?u=' + nested, max_redirects=4),
+            'https://ddg.co/',
+        )
+
+    def test_no_recursion(self):
+        nested = 'https://r.to/?u=' * 3 + 'https://ddg.co/'
+        self.assertEqual(
+            self.rules.clean(nested, recurse_redir=False),
+            'https://r.to/?u=' * 2 + 'https://ddg.co/',
+        )
+
+    def test_pickle_skips_memo(self):
+        self.rules.clean('https://r.to/?u=https://ddg.co/')
+        rules = pickle.loads(pickle.dumps(self.rules))
+        self.assertEqual(rules._redirect_memo, {})
+        self.assertEqual(
+            rules.clean('https://r.to/?u=https://ddg.co/'), 'https://ddg.co/',
+        )
+
+
+class TestCompiledRules(unittest.TestCase):
+    rules = {'providers': {
+        'example': {
+            'urlPattern': '^https?:\\/\\/(?:[a-z0-9-]+\\.)*?example\\.com',
+            'exceptions': ['^https?:\\/\\/example\\.com\\/keep'],
+            'rules': ['utm_[a-z]+'],
+            'referralMarketing': ['ref'],
+            'rawRules': ['\\/tracking'],
+        },
+        'broken': {'urlPattern': '(', 'rules': ['x']},
+    }}
+
+    def setUp(self):
+        self.compiled = url.CompiledRules(self.rules)
+
+    def test_strips_params_and_raw_rules(self):
+        self.assertEqual(
+            self.compiled.clean(
+                'https://www.example.com/tracking/a?utm_source=x&id=1&ref=y',
+            ),
+            'https://www.example.com/a?id=1',
+        )
+
+    def test_leaves_url_untouched_if_no_params_removed(self):
+        in_url = 'https://example.com/a?q=a+b&empty&x=%7E'
+        self.assertEqual(self.compiled.clean(in_url), in_url)
+
+    def test_uncombinable_param_rules(self):
+        provider = url.CompiledProvider('dup', {
+            'urlPattern': '^',
+            'rules': ['(?P<x>a)', '(?P<x>b)'],
+        })
+        self.assertEqual(
+            provider.strip_params('https://x.org/?a=1&b=2&c=3'),
+            'https://x.org/?c=3',
+        )
+
+    def test_param_rules_with_backreferences(self):
+        provider = url.CompiledProvider('backref', {
+            'urlPattern': '^',
+            'rules': ['(x)y', '(a)\\1'],
+        })
+        self.assertEqual(
+            provider.strip_params('https://x.org/?aa=1&xy=2&ab=3'),
+            'https://x.org/?ab=3',
+        )
+
+    def test_skips_provider_on_exception(self):
+        in_url = 'https://example.com/keep?utm_source=x'
+        self.assertEqual(self.compiled.clean(in_url), in_url)
+
+    def test_invalid_url_pattern_never_matches(self):
+        in_url = 'https://other.org/?x=1'
+        self.assertEqual(self.compiled.clean(in_url), in_url)
+
+    def test_fingerprint_changes_with_rules(self):
+        changed = {'providers': dict(
+            self.rules['providers'], example=dict(
+                self.rules['providers']['example'], rules=['utm_.*'],
+            ),
+        )}
+        self.assertEqual(
+            self.compiled.fingerprint,
+            url.CompiledRules(self.rules).fingerprint,
+        )
+        self.assertNotEqual(
+            self.compiled.fingerprint, url.CompiledRules(changed).fingerprint,
+        )
+
+    def test_clean_url_accepts_compiled_rules(self):
+        in_url = 'https://example.com/?utm_medium=a&q=b'
+        self.assertEqual(
+            url.clean_url(self.compiled, in_url),
+            url.clean_url(self.rules, in_url),
+        )
+
+
+class TestHostIndex(unittest.TestCase):
+    def test_pattern_host_key(self):
+        for pattern, expected in (
+            ('^https?:\\/\\/(?:[a-z0-9-]+\\.)*?amazon(?:\\.[a-z]{2,}){1,}',
+             'amazon'),
+            ('^https?:\\/\\/(?:[a-z0-9-]+\\.)*?fls-na\\.amazon', 'fls-na'),
+            ('^https?:\\/\\/vk\\.com', 'vk'),
+            ('.*', None),
+            ('^https?:\\/\\/(?:[a-z0-9-]+\\.)*?twitter.com', None),
+            ('^https?:\\/\\/(?:accounts\\.)?firefox\\.com', None),
+            ('^https?:\\/\\/a\\.com|.*', None),
+            ('^https?:\\/\\/amazon\\.?com', None),
+        ):
+            with self.subTest(pattern=pattern):
+                self.assertEqual(url.pattern_host_key(pattern), expected)
+
+    def test_candidates(self):
+        rules = url.CompiledRules({'providers': {
+            'amazon': {'urlPattern': '^https?:\\/\\/amazon\\.com'},
+            'global': {'urlPattern': '.*'},
+            'google': {'urlPattern': '^https?:\\/\\/google\\.com'},
+        }})
+        self.assertEqual(
+            [p.name for p in rules.candidates('https://google.com/')],
+            ['global', 'google'],
+        )
+        self.assertEqual(
+            [p.name for p in rules.candidates('HTTPS://WWW.AMAZON.COM/')],
+            ['amazon', 'global'],
+        )
+
+
+class TestRulesUpdate(unittest.TestCase):
+    providers = {
+        'amazon': {'urlPattern': '^https?:\\/\\/amazon\\.com',
+                   'rules': ['tag']},
+        'global': {'urlPattern': '.*', 'rules': ['utm_[a-z]+']},
+        'google': {'urlPattern': '^https?:\\/\\/google\\.com',
+                   'rules': ['ei']},
+    }
+
+    def setUp(self):
+        self.rules = url.CompiledRules({'providers': self.providers})
+
+    def assert_same_as_compiled(self, updated, rules_data):
+        compiled = url.CompiledRules(rules_data)
+        self.assertEqual(updated.fingerprint, compiled.fingerprint)
+        self.assertEqual(updated.host_index, compiled.host_index)
+        self.assertEqual(updated.unindexed, compiled.unindexed)
+        for in_url in (
+            'https://amazon.com/?tag=a&utm_source=b&ei=c',
+            'https://google.com/?tag=a&utm_source=b&ei=c',
+            'https://bing.com/?tag=a&utm_source=b&ei=c&x=d',
+        ):
+            self.assertEqual(updated.clean(in_url), compiled.clean(in_url))
+
+    def test_unchanged(self):
+        updated, diff = self.rules.updated({'providers': self.providers})
+        self.assertIs(updated, self.rules)
+        self.assertFalse(diff)
+        self.assertEqual(diff.unchanged, ['amazon', 'global', 'google'])
+
+    def test_changed_provider_is_recompiled(self):
+        rules_data = {'providers': dict(self.providers, google={
+            'urlPattern': '^https?:\\/\\/bing\\.com', 'rules': ['x'],
+        })}
+        with mock.patch.object(
+                url, 'CompiledProvider', wraps=url.CompiledProvider,
+        ) as compile_provider:
+            updated, diff = self.rules.updated(rules_data)
+        self.assertEqual(compile_provider.call_count, 1)
+
+        self.assertTrue(diff)
+        self.assertEqual(diff.changed, ['google'])
+        self.assertEqual((diff.added, diff.removed), ([], []))
+        self.assertEqual(str(diff), '0 added, 0 removed, 1 changed, '
+                                    '2 unchanged')
+        self.assertIs(updated.providers[0], self.rules.providers[0])
+        self.assertIsNot(updated.providers[2], self.rules.providers[2])
+        self.assertIn('google', self.rules.host_index)
+        self.assert_same_as_compiled(updated, rules_data)
+
+    def test_added_and_removed_providers(self):
+        providers = dict(self.providers)
+        del providers['amazon']
+        providers['bing'] = {
+            'urlPattern': '^https?:\\/\\/bing\\.com', 'rules': ['x'],
+        }
+        rules_data = {'providers': providers}
+        updated, diff = self.rules.updated(rules_data)
+
+        self.assertEqual(diff.added, ['bing'])
+        self.assertEqual(diff.removed, ['amazon'])
+        self.assertEqual(diff.unchanged, ['global', 'google'])
+        self.assertIs(updated.providers[0], self.rules.providers[1])
+        self.assert_same_as_compiled(updated, rules_data)
+
+    def test_update_cleaning_rules(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rules_path = os.path.join(tmp_dir, 'rules.json')
+            cache_path = os.path.join(tmp_dir, 'rules.cache')
+            rules_data = {'providers': dict(self.providers, amazon={
+                'urlPattern': '^https?:\\/\\/amazon\\.com',
+                'rules': ['ref'],
+            })}
+            with open(rules_path, 'w', encoding='UTF-8') as rules_file:
+                json.dump(rules_data, rules_file)
+
+            updated, diff = url.update_cleaning_rules(
+                self.rules, rules_path, cache_path,
+            )
+            self.assertEqual(diff.changed, ['amazon'])
+            self.assertEqual(
+                url.load_rules_cache(cache_path, rules_path).fingerprint,
+                updated.fingerprint,
+            )
+        self.assert_same_as_compiled(updated, rules_data)
+
+
+class TestRulesCache(unittest.TestCase):
+    rules = {'providers': {'example': {
+        'urlPattern': '^https?:\\/\\/example\\.com',
+        'rules': ['utm_[a-z]+'],
+    }}}
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.rules_path = os.path.join(tmp_dir.name, 'rules.json')
+        self.cache_path = os.path.join(tmp_dir.name, 'rules.cache')
+        self.write_rules(self.rules)
+
+    def write_rules(self, rules):
+        with open(self.rules_path, 'w', encoding='UTF-8') as rules_file:
+            json.dump(rules, rules_file)
+
+    def test_uses_cache_until_rules_file_changes(self):
+        url.load_cleaning_rules(self.rules_path, self.cache_path)
+        cached = url.load_rules_cache(self.cache_path, self.rules_path)
+        self.assertEqual(
+            cached.clean('https://example.com/?utm_source=x&id=1'),
+            'https://example.com/?id=1',
+        )
+
+        self.write_rules({'providers': {}})
+        os.utime(self.rules_path, ns=(0, 0))
+        self.assertIsNone(
+            url.load_rules_cache(self.cache_path, self.rules_path),
+        )
+        self.assertEqual(
+            len(url.load_cleaning_rules(self.rules_path, self.cache_path)),
+            0,
+        )
+
+    def test_ignores_corrupt_cache(self):
+        with open(self.cache_path, 'wb') as cache_file:
+            cache_file.write(b'not a pickle')
+        self.assertEqual(
+            len(url.load_cleaning_rules(self.rules_path, self.cache_path)),
+            1,
+        )
+
+
+class RulesHandler(BaseHTTPRequestHandler):
+    """Serves `server.body` with an ETag, honouring If-None-Match."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.server.requests.append(dict(self.headers))
+        if self.server.status != 200:
+            self.send_error(self.server.status)
+            return
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, *_args):  # pylint: disable=arguments-differ
+        pass
+
+
+class TestDownloadRulesData(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), RulesHandler)
+        self.server.requests = []
+        self.server.status = 200
+        self.server.etag = '"v1"'
+        self.server.body = b'{"providers": {}}'
+        thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={'poll_interval': 0.01},
+        )
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/rules.json'
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.rules_path = os.path.join(tmp_dir.name, 'rules.json')
+
+    def download(self, **kwargs):
+        return url.download_rules_data(self.rules_path, url=self.url, **kwargs)
+
+    def read_rules(self):
+        with open(self.rules_path, encoding='UTF-8') as rules_file:
+            return rules_file.read()
+
+    def test_conditional_download(self):
+        self.assertTrue(self.download(conditional=True))
+        self.assertEqual(self.read_rules(), '{"providers": {}}')
+
+        self.assertFalse(self.download(conditional=True))
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], '"v1"')
+
+        self.server.etag = '"v2"'
+        self.server.body = b'{"providers": {"new": {"urlPattern": "^"}}}'
+        self.assertTrue(self.download(conditional=True))
+        self.assertIn('new', self.read_rules())
+
+    def test_unconditional_download_ignores_validators(self):
+        self.download()
+        self.assertTrue(self.download())
+        self.assertNotIn('If-None-Match', self.server.requests[-1])
+
+    def test_failed_download_keeps_rules(self):
+        self.download()
+        self.server.status = 500
+        with self.assertRaises(HTTPError):
+            self.download()
+        self.assertEqual(self.read_rules(), '{"providers": {}}')
+
+        self.server.status = 200
+        self.server.etag = '"v2"'
+        self.server.body = b'<html>captive portal</html>'
+        with self.assertRaises(ValueError):
+            self.download()
+        self.assertEqual(self.read_rules(), '{"providers": {}}')
+        self.assertEqual(
+            sorted(os.listdir(self.tmp_dir)),
+            ['rules.json', 'rules.json.validators'],
+        )
+
+    def test_refresh_in_background(self):
+        updated = threading.Event()
+        url.refresh_rules_in_background(
+            self.rules_path, updated.set, url=self.url,
+        ).join()
+        self.assertTrue(updated.is_set())
+        self.assertLess(url.rules_data_age(self.rules_path), 60)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from uroute.util import (
+    chunked, load_pickle, save_pickle_atomic, spawn_detached,
+)
+
+
+class TestChunked(unittest.TestCase):
+    def test_chunked(self):
+        self.assertEqual(
+            list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]],
+        )
+
+
+class TestPickle(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'test.cache')
+
+    def test_round_trip_with_key(self):
+        self.assertTrue(save_pickle_atomic(self.path, ('v1', 'x'), [1, 2]))
+        self.assertEqual(load_pickle(self.path, ('v1', 'x')), [1, 2])
+        self.assertIsNone(load_pickle(self.path, ('v2', 'x')))
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.path)), ['test.cache'],
+        )
+
+    def test_missing_or_unreadable(self):
+        self.assertIsNone(load_pickle(self.path, 'key'))
+        with open(self.path, 'wb') as cache_file:
+            cache_file.write(b'not a pickle')
+        with self.assertLogs('uroute.util', 'WARNING'):
+            self.assertIsNone(load_pickle(self.path, 'key'))
+
+    def test_concurrent_saves(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda num=num: results.append(
+                save_pickle_atomic(self.path, 'key', [num] * 10000),
+            ))
+            for num in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 8)
+        self.assertEqual(len(set(load_pickle(self.path, 'key'))), 1)
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.path)), ['test.cache'],
+        )
+
+    def test_unpicklable(self):
+        with self.assertLogs('uroute.util', 'WARNING'):
+            self.assertFalse(
+                save_pickle_atomic(self.path, 'key', lambda: None),
+            )
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), [])
+
+
+class TestSpawnDetached(unittest.TestCase):
+    def test_spawns_in_new_session_without_waiting(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_path = os.path.join(tmp_dir, 'sid')
+            script = (
+                'import os, sys, time; time.sleep(0.3); print("noise"); '
+                f'open({out_path!r} + ".tmp", "w").write(str(os.getsid(0))); '
+                f'os.replace({out_path!r} + ".tmp", {out_path!r})'
+            )
+
+            start = time.monotonic()
+            pid = spawn_detached([sys.executable, '-c', script])
+            self.assertLess(time.monotonic() - start, 0.25)
+
+            for _ in range(100):
+                if os.path.exists(out_path):
+                    break
+                time.sleep(0.05)
+            with open(out_path, encoding='UTF-8') as out_file:
+                sid = int(out_file.read())
+        self.assertEqual(sid, pid)
+        self.assertNotEqual(sid, os.getsid(0))
+
+    def test_missing_program(self):
+        with self.assertRaises(OSError):
+            spawn_detached(['/nonexistent/browser', 'https://x.org/'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from uroute import xdgdesktop
+from uroute.xdgdesktop import DesktopEntryIndex, exec_to_command
+
+FIREFOX_ENTRY = """\
+[Desktop Entry]
+Version=1.0
+Type=Application
+Name=Firefox
+Name[de]=Feuerfuchs
+Exec=firefox %u
+Icon=firefox
+Categories=Network;WebBrowser;
+Actions=new-window;new-private-window;
+
+[Desktop Action new-window]
+Name=New Window
+Exec=firefox --new-window %u
+
+[Desktop Action new-private-window]
+Name=New Private Window
+Exec=firefox --private-window %u
+Icon=firefox-private
+"""
+
+MIME_ENTRY = """\
+[Desktop Entry]
+Type=Application
+Name=Links
+Exec=links "%U"
+MimeType=text/html;x-scheme-handler/http;
+"""
+
+EDITOR_ENTRY = """\
+[Desktop Entry]
+Type=Application
+Name=Vim
+Exec=vim %F
+Categories=Utility;TextEditor;
+"""
+
+HIDDEN_ENTRY = """\
+[Desktop Entry]
+Type=Application
+Name=Firefox
+Exec=firefox %u
+Categories=WebBrowser;
+Hidden=true
+"""
+
+
+class TestExecToCommand(unittest.TestCase):
+    def test_field_codes(self):
+        self.assertEqual(
+            exec_to_command('firefox --new-window %u'),
+            'firefox --new-window @URL',
+        )
+        self.assertEqual(
+            exec_to_command('browser %i --class %c %k %U'),
+            'browser --class @URL',
+        )
+        self.assertEqual(
+            exec_to_command('"/opt/My Browser/run" --x=100%%'),
+            "'/opt/My Browser/run' --x=100%",
+        )
+
+    def test_invalid(self):
+        self.assertIsNone(exec_to_command('browser "unterminated'))
+        self.assertIsNone(exec_to_command(''))
+
+
+class TestDesktopEntryIndex(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_dir = self._tmp_dir.name
+        self.data_dirs = [
+            os.path.join(self.tmp_dir, name) for name in ('home', 'system')
+        ]
+        self.write_entry('system', 'firefox.desktop', FIREFOX_ENTRY)
+        self.write_entry('system', 'vim.desktop', EDITOR_ENTRY)
+        self.write_entry('system', 'text/links.desktop', MIME_ENTRY)
+        self.index = DesktopEntryIndex(self.data_dirs)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def write_entry(self, data_dir, rel_path, content):
+        path = os.path.join(self.tmp_dir, data_dir, 'applications', rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='UTF-8') as desktop_file:
+            desktop_file.write(content)
+        return path
+
+    def test_browsers(self):
+        self.index.scan()
+        firefox, links = self.index.browsers()
+
+        self.assertEqual(firefox.desktop_id, 'firefox.desktop')
+        self.assertEqual(firefox.name, 'Firefox')
+        self.assertEqual(firefox.command, 'firefox @URL')
+        self.assertEqual(firefox.icon, 'firefox')
+        self.assertEqual(
+            [(a.action_id, a.name, a.command, a.icon)
+             for a in firefox.actions],
+            [
+                ('new-window', 'New Window', 'firefox --new-window @URL',
+                 'firefox'),
+                ('new-private-window', 'New Private Window',
+                 'firefox --private-window @URL', 'firefox-private'),
+            ],
+        )
+
+        self.assertEqual(links.desktop_id, 'text-links.desktop')
+        self.assertEqual(links.command, 'links @URL')
+
+    def test_earlier_data_dir_hides_entry(self):
+        self.write_entry('home', 'firefox.desktop', HIDDEN_ENTRY)
+        self.index.scan()
+        self.assertEqual(
+            [entry.name for entry in self.index.browsers()], ['Links'],
+        )
+
+    def test_rescan_only_parses_changed_entries(self):
+        self.index.scan()
+        self.assertTrue(self.index.modified)
+        self.index.modified = False
+
+        with mock.patch.object(
+                xdgdesktop, 'parse_browser_entry',
+                wraps=xdgdesktop.parse_browser_entry) as parse:
+            self.index.scan()
+            parse.assert_not_called()
+            self.assertFalse(self.index.modified)
+
+            path = self.write_entry('home', 'chromium.desktop', MIME_ENTRY)
+            self.index.scan()
+            parse.assert_called_once_with(path, 'chromium.desktop')
+        self.assertTrue(self.index.modified)
+        self.assertEqual(len(self.index.browsers()), 3)
+
+    def test_save_and_load(self):
+        index_path = os.path.join(self.tmp_dir, 'index.cache')
+        self.index.scan()
+        self.index.save(index_path)
+
+        index = DesktopEntryIndex(self.data_dirs)
+        index.load(index_path)
+        with mock.patch.object(xdgdesktop, 'parse_browser_entry') as parse:
+            index.scan()
+            parse.assert_not_called()
+        self.assertEqual(index.browsers(), self.index.browsers())
+
+    def test_load_ignores_other_data_dirs(self):
+        index_path = os.path.join(self.tmp_dir, 'index.cache')
+        self.index.scan()
+        self.index.save(index_path)
+
+        index = DesktopEntryIndex(self.data_dirs[:1])
+        index.load(index_path)
+        index.scan()
+        self.assertEqual(index.browsers(), [])
+
+
+class TestGetDefaultBrowser(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        tmp_dir = self._tmp_dir.name
+        self.mimeapps_path = os.path.join(tmp_dir, 'mimeapps.list')
+        self.write_mimeapps('firefox.desktop')
+
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(
+            xdgdesktop, '_mimeapps_list_paths',
+            return_value=[self.mimeapps_path],
+        ).start()
+        mock.patch.object(
+            xdgdesktop, '_default_browser_cache_path',
+            return_value=os.path.join(tmp_dir, 'default-browser.json'),
+        ).start()
+        mock.patch.object(xdgdesktop, 'which', return_value=True).start()
+        self.check_output = mock.patch.object(
+            xdgdesktop.subprocess, 'check_output',
+            return_value=b'firefox.desktop\n',
+        ).start()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def write_mimeapps(self, desktop_id):
+        with open(self.mimeapps_path, 'w', encoding='UTF-8') as mimeapps:
+            mimeapps.write(
+                '[Default Applications]\n'
+                f'x-scheme-handler/http={desktop_id}\n'
+            )
+
+    def test_cached_until_mimeapps_list_changes(self):
+        self.assertEqual(xdgdesktop.get_default_browser(), 'firefox.desktop')
+        self.assertEqual(xdgdesktop.get_default_browser(), 'firefox.desktop')
+        self.assertEqual(self.check_output.call_count, 1)
+
+        self.write_mimeapps('uroute.desktop')
+        os.utime(self.mimeapps_path, ns=(0, 0))
+        self.check_output.return_value = b'uroute.desktop\n'
+        self.assertEqual(xdgdesktop.get_default_browser(), 'uroute.desktop')
+        self.assertEqual(self.check_output.call_count, 2)
+
+    def test_no_cache(self):
+        xdgdesktop.get_default_browser()
+        xdgdesktop.get_default_browser(use_cache=False)
+        self.assertEqual(self.check_output.call_count, 2)
+
+    def test_set_default_browser_clears_cache(self):
+        xdgdesktop.get_default_browser()
+        desktop = mock.Mock()
+        desktop.getFileName.return_value = '/apps/uroute.desktop'
+        self.assertTrue(xdgdesktop.set_default_browser(desktop))
+        xdgdesktop.get_default_browser()
+        self.assertEqual(self.check_output.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
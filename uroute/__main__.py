@@ -2,10 +2,11 @@
 
 import argparse
 import logging
+import os
 import sys
 
+from uroute import daemon, trace
 from uroute.core import Uroute
-from uroute.gui import UrouteGui
 
 log = logging.getLogger(__name__)
 
@@ -13,12 +14,42 @@ log = logging.getLogger(__name__)
 def create_argument_parser():
     parser = argparse.ArgumentParser(
         description='Route URL to a configured program.',
+        epilog='Run "uroute clean --help" to clean URLs without the GUI.',
     )
 
     parser.add_argument('URL', nargs='?', help='URL to route.')
     parser.add_argument(
         '--program', '-p', help='Preselect the specified program.',
     )
+    parser.add_argument(
+        '--ask', '-a', action='store_true',
+        help='Always show the window, even if a route matches the URL.',
+    )
+    parser.add_argument(
+        '--daemon', action='store_true',
+        help=(
+            'Keep running in the background, with the window ready to show '
+            'URLs routed by later uroute invocations.'
+        ),
+    )
+    parser.add_argument(
+        '--no-daemon', action='store_true',
+        help="Don't hand the URL to a running daemon.",
+    )
+    parser.add_argument(
+        '--trace', metavar='FILE',
+        help=(
+            'Write timings of startup and URL handling to FILE, as a Chrome '
+            f'trace. Also enabled by ${trace.ENV_TRACE}.'
+        ),
+    )
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help=(
+            'Profile startup until the window is shown, and write the '
+            f'cProfile stats to FILE. Also enabled by ${trace.ENV_PROFILE}.'
+        ),
+    )
     parser.add_argument(
         '--version', action='store_true', help='Print version and exit.',
     )
@@ -26,8 +57,90 @@ def create_argument_parser():
     return parser
 
 
+def create_clean_argument_parser():
+    # Imported here, to keep multiprocessing out of GUI startup
+    from uroute import batch  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog='uroute clean',
+        description=(
+            'Clean URLs, one per line, and write them to stdout. Without '
+            'the GUI.'
+        ),
+    )
+
+    parser.add_argument(
+        'FILE', nargs='*',
+        help='File to read URLs from. Reads stdin if omitted or "-".',
+    )
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=1,
+        help='Number of worker processes. 0 uses all CPUs. Default: 1',
+    )
+    parser.add_argument(
+        '--extract', '-x', action='store_true',
+        help='Read any text, and clean every URL found in it.',
+    )
+    parser.add_argument(
+        '--unshorten', action='store_true',
+        help='Resolve short URLs of known URL shorteners.',
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=batch.DEFAULT_CHUNK_SIZE,
+        help=(
+            'Number of URLs sent to a worker process at a time. Default: '
+            f'{batch.DEFAULT_CHUNK_SIZE}'
+        ),
+    )
+
+    return parser
+
+
+def clean(options):
+    from uroute import batch  # pylint: disable=import-outside-toplevel
+
+    ur = Uroute()
+    rules = ur.load_cleaning_rules()
+
+    lines = batch.read_lines(options.FILE)
+    if options.extract:
+        lines = batch.extract_lines(lines)
+
+    if options.jobs == 1:
+        cleaned = batch.clean_lines(ur.apply_cleaning_rules, lines)
+    else:
+        cleaned = batch.clean_lines_parallel(
+            rules, lines,
+            jobs=options.jobs or None, chunk_size=options.chunk_size,
+        )
+
+    if options.unshorten:
+        cleaned = batch.unshorten_lines(
+            ur.unshortener or ur.create_unshortener(), cleaned,
+            clean=ur.apply_cleaning_rules, chunk_size=options.chunk_size,
+        )
+
+    try:
+        batch.write_lines(cleaned, chunk_size=options.chunk_size)
+    except BrokenPipeError:
+        # Output was closed early, e.g. piped into `head`. Avoid another
+        # error when Python flushes stdout on exit.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
 def main():
+    if sys.argv[1:2] == ['clean']:
+        try:
+            clean(create_clean_argument_parser().parse_args(sys.argv[2:]))
+        except Exception as error:  # pylint: disable=broad-except
+            log.exception(str(error))
+            sys.exit(1)
+        return
+
     options = create_argument_parser().parse_args()
+    trace.enable(options.trace, options.profile)
 
     if options.version:
         # pylint: disable=import-outside-toplevel
@@ -35,9 +148,33 @@ def main():
         print(f'Uroute {VERSION}')
         sys.exit(0)
 
+    if options.daemon:
+        try:
+            daemon.Daemon().run()
+        except Exception as error:  # pylint: disable=broad-except
+            log.exception(str(error))
+            sys.exit(1)
+        return
+
+    # Routes are not applied when a program was explicitly selected
+    ask = options.ask or bool(options.program)
+    if not options.no_daemon and daemon.send_url(
+            options.URL, options.program, ask=ask,
+    ):
+        return
+
     ur = Uroute(preferred_prog=options.program)
 
     try:
+        routed = options.URL and not ask and ur.route_url(options.URL)
+        if routed:
+            ur.run(*routed)
+            return
+
+        # Importing GTK is slow, so only do it once a window is needed
+        with trace.span('GTK import'):
+            # pylint: disable=import-outside-toplevel
+            from uroute.gui import UrouteGui
         command, url = UrouteGui(ur).run(options.URL)
         log.debug('Command: %r, URL: %r', command, url)
         if command:
@@ -0,0 +1,108 @@
+"""Headless cleaning of URLs in bulk."""
+
+import collections
+import logging
+import multiprocessing
+import sys
+
+from uroute.url import extract_urls
+from uroute.util import chunked
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# The rules used by `multiprocessing` worker processes
+_worker_rules = None  # pylint: disable=invalid-name
+
+
+def read_lines(filenames=None):
+    """Yields lines, without line endings, from each of `filenames`.
+
+    Lines are read from stdin if no file names are given, or for a file
+    name of ``-``. Files are streamed, not read into memory.
+    """
+    for filename in filenames or ['-']:
+        if filename == '-':
+            yield from (line.rstrip('\r\n') for line in sys.stdin)
+            continue
+        with open(filename, encoding='UTF-8', errors='replace') as lines:
+            yield from (line.rstrip('\r\n') for line in lines)
+
+
+def clean_lines(clean, lines):
+    """Yields the result of `clean` for every URL in `lines`.
+
+    Leading and trailing white space is removed; blank lines are passed
+    through as empty lines, so that output lines match input lines.
+    """
+    for line in lines:
+        url = line.strip()
+        yield clean(url) if url else ''
+
+
+def extract_lines(lines):
+    """Yields every URL found in the text of `lines`, one at a time."""
+    for line in lines:
+        yield from extract_urls(line)
+
+
+def _init_worker(rules):
+    global _worker_rules  # pylint: disable=global-statement
+    _worker_rules = rules
+
+
+def _clean_chunk(lines):
+    return list(clean_lines(_worker_rules.clean, lines))
+
+
+def clean_lines_parallel(
+    rules, lines, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    """Like :func:`clean_lines`, but cleans with `rules` in `jobs` worker
+    processes.
+
+    `lines` is sent to the workers in chunks of `chunk_size` lines, and
+    cleaned URLs are yielded in input order. At most two chunks per
+    worker are in flight at a time, so memory use is bounded no matter
+    how many lines are read.
+    """
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    with multiprocessing.Pool(
+        jobs, initializer=_init_worker, initargs=(rules,),
+    ) as pool:
+        pending = collections.deque()
+        for chunk in chunked(lines, chunk_size):
+            pending.append(pool.apply_async(_clean_chunk, (chunk,)))
+            if len(pending) >= jobs * 2:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def unshorten_lines(
+    unshortener, lines, clean=None, chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    """Yields `lines`, with short URLs resolved by `unshortener`.
+
+    The short URLs in each chunk of `chunk_size` lines are resolved
+    concurrently, and their targets cleaned with `clean`.
+    """
+    for chunk in chunked(lines, chunk_size):
+        yield from unshortener.run(unshortener.resolve_many(chunk, clean))
+
+
+def write_lines(lines, out=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Writes `lines` to `out` (stdout by default) in batches."""
+    if out is None:
+        out = sys.stdout
+    count = 0
+    for chunk in chunked(lines, chunk_size):
+        out.write('\n'.join(chunk))
+        out.write('\n')
+        count += len(chunk)
+    out.flush()
+    log.debug('Wrote %d lines', count)
+    return count
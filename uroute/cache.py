@@ -0,0 +1,74 @@
+"""In-memory caches that can be persisted across Uroute processes."""
+
+import logging
+from collections import OrderedDict
+
+from uroute.__version__ import VERSION
+from uroute.util import load_pickle, save_pickle_atomic
+
+log = logging.getLogger(__name__)
+
+
+class LruCache:
+    """A mapping of at most `maxsize` items, which evicts the least
+    recently used item when full.
+
+    Cache `hits` and `misses` are counted by :meth:`get`.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.modified = False
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        self.modified = True
+
+    def clear(self):
+        self._items.clear()
+        self.modified = True
+
+    def load(self, path):
+        """Adds the items saved to `path` by :meth:`save`.
+
+        Caches saved by a different version of Uroute are ignored.
+        """
+        items = load_pickle(path, VERSION)
+        if items is None:
+            return
+        for key, value in items:
+            self.put(key, value)
+        self.modified = False
+        log.debug('Loaded %d cache items from %r', len(items), path)
+
+    def save(self, path):
+        """Atomically saves the cached items to `path`, if modified."""
+        log.debug(
+            'Cache %r: %d items, %d hits, %d misses',
+            path, len(self), self.hits, self.misses,
+        )
+        if self.modified and save_pickle_atomic(
+                path, VERSION, list(self._items.items())):
+            self.modified = False
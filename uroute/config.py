@@ -1,20 +1,73 @@
 """Creating and managing Uroute configuraiton."""
 
+import contextlib
+import fcntl
+import hashlib
+import logging
 import os
-from configparser import ConfigParser
+import threading
+from configparser import ConfigParser, Error as ConfigParserError
 
 from xdg import BaseDirectory
 
+from uroute import xdgdesktop
+from uroute.__version__ import VERSION
+from uroute.util import load_pickle, save_pickle_atomic
+
+log = logging.getLogger(__name__)
 
 DEFAULT_CONFIG = os.path.join(
     BaseDirectory.xdg_config_home, 'uroute', 'uroute.ini'
 )
+SNAPSHOT_FORMAT = 2
 
 
-def create_initial_config(filename):
+def _add_desktop_browsers(config):
+    """Adds a program for each installed browser's desktop entry, and
+    each of its desktop actions, to `config`.
+
+    Returns the ID of the program to use as default, or `None` if no
+    browsers were found.
+    """
+    default_browser = None
+    private_browser = None
+    for entry in xdgdesktop.find_browsers():
+        prog_id = entry.desktop_id[:-len('.desktop')]
+        programs = [(prog_id, entry.name, entry.command, entry.icon)]
+        programs.extend(
+            (f'{prog_id}-{action.action_id}', f'{entry.name}: {action.name}',
+             action.command, action.icon)
+            for action in entry.actions
+        )
+
+        for prog_id, name, command, icon in programs:
+            section = {'name': name, 'command': command}
+            icon_path = xdgdesktop.get_icon_path(icon)
+            if icon_path:
+                section['icon'] = icon_path
+            # Escape '%' for the config's value interpolation
+            config[f'program:{prog_id}'] = {
+                key: value.replace('%', '%%')
+                for key, value in section.items()
+            }
+
+            if not default_browser:
+                default_browser = prog_id
+            if not private_browser and any(
+                    mode in prog_id.lower()
+                    for mode in ('private', 'incognito')):
+                private_browser = prog_id
+
+    return private_browser or default_browser
+
+
+def _add_python_browsers(config):
+    """Adds programs for the browsers known to the `webbrowser` module to
+    `config`.
+
+    Returns the ID of the program to use as default, or `None`.
+    """
     import webbrowser  # pylint: disable=import-outside-toplevel
-    config = ConfigParser()
-    config['main'] = {}  # Just to make sure 'main' is added first
     default_browser = None
 
     # pylint: disable=protected-access
@@ -46,22 +99,81 @@ def create_initial_config(filename):
             if not default_browser:
                 default_browser = 'chromium-incognito'
 
+    return default_browser
+
+
+def create_initial_config(filename):
+    config = ConfigParser()
+    config['main'] = {}  # Just to make sure 'main' is added first
+
+    default_browser = _add_desktop_browsers(config)
+    if default_browser is None:
+        log.debug('No browser desktop entries found')
+        default_browser = _add_python_browsers(config)
+
     if default_browser:
         config['main'] = {'default_program': default_browser}
 
-    with open(filename, 'w', encoding='UTF-8') as config_file:
-        config.write(config_file)
+    _write_atomic(filename, config.write)
 
 
-class Config(ConfigParser):
-    """Uroute configuraiton."""
+@contextlib.contextmanager
+def _locked(lock_path):
+    # Serializes writes to a file between Uroute processes
+    with open(lock_path, 'a', encoding='UTF-8') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 
-    def __init__(self, filename=None):
+def _write_atomic(filename, write):
+    """Calls `write` with a temporary file, and then moves that file to
+    `filename`, keeping the original file's permissions.
+    """
+    tmp_path = f'{filename}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='UTF-8') as tmp_file:
+            with contextlib.suppress(FileNotFoundError):
+                os.chmod(tmp_path, os.stat(filename).st_mode & 0o7777)
+            write(tmp_file)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+class Config(ConfigParser):  # pylint: disable=too-many-instance-attributes
+    """Uroute configuraiton.
+
+    The parsed configuration is saved as a snapshot in the XDG cache dir,
+    along with any values derived from it with :meth:`derive`. As long as
+    the configuration file's mtime and content hash match the snapshot,
+    later instances load the snapshot instead of parsing the file.
+    """
+
+    def __init__(self, filename=None, snapshot_path=None):
         super().__init__()
 
         if filename is None:
             filename = DEFAULT_CONFIG
         self.filename = filename
+        if snapshot_path is None:
+            snapshot_path = xdgdesktop.get_cache_file_path('config.snapshot')
+        self.snapshot_path = snapshot_path
+        self.lock_path = xdgdesktop.get_runtime_file_path('config.lock')
+        self._derived = {}
+        self._snapshot_key = None
+        self._snapshot_sections = None
+        self._snapshot_modified = False
+        self._pending = {}
+        self._original_values = {}
+        self._transaction_depth = 0
+        self._write_lock = threading.RLock()
 
         if not os.path.isfile(filename):
             dirname = os.path.dirname(filename)
@@ -71,24 +183,204 @@ class Config(ConfigParser):
             create_initial_config(filename)
 
         self.clear()
-        self.read(filename)
+        self._load()
 
         if not self.has_section('main'):
             self['main'] = {}
 
+    def _load(self):
+        with open(self.filename, 'rb') as config_file:
+            mtime_ns = os.fstat(config_file.fileno()).st_mtime_ns
+            data = config_file.read()
+        self._snapshot_key = (
+            SNAPSHOT_FORMAT, VERSION, os.path.abspath(self.filename),
+            mtime_ns, hashlib.sha1(data).hexdigest(),
+        )
+
+        snapshot = self._load_snapshot()
+        if snapshot is not None:
+            self._snapshot_sections = snapshot['sections']
+            self.read_dict(self._snapshot_sections)
+            self._derived = snapshot['derived']
+            log.debug('Loaded config snapshot %r', self.snapshot_path)
+            return
+
+        self.read_string(data.decode('UTF-8'), source=self.filename)
+        # Raw values, so that they can be read back without interpolation
+        defaults = self.defaults()
+        self._snapshot_sections = {'DEFAULT': dict(defaults)}
+        for section in self.sections():
+            self._snapshot_sections[section] = {
+                key: value for key, value in self.items(section, raw=True)
+                if defaults.get(key) != value
+            }
+        self._snapshot_modified = True
+
+    def _load_snapshot(self):
+        snapshot = load_pickle(self.snapshot_path, self._snapshot_key)
+        if snapshot is None:
+            log.debug('No usable config snapshot %r', self.snapshot_path)
+        return snapshot
+
+    def derive(self, name, build):
+        """Returns the value called `name` that is derived from the
+        configuration by calling `build()`.
+
+        Derived values are saved in the snapshot with :meth:`save_snapshot`,
+        and only rebuilt when the configuration file changes. They must be
+        picklable.
+        """
+        try:
+            return self._derived[name]
+        except KeyError:
+            pass
+        value = self._derived[name] = build()
+        self._snapshot_modified = True
+        return value
+
+    def save_snapshot(self):
+        """Atomically saves the configuration snapshot, if it changed."""
+        if not self._snapshot_modified:
+            return
+
+        snapshot = {
+            'sections': self._snapshot_sections, 'derived': self._derived,
+        }
+        if save_pickle_atomic(
+                self.snapshot_path, self._snapshot_key, snapshot):
+            self._snapshot_modified = False
+
     def read_bool(self, setting, section='main', fallback=True):
         try:
-            value = self[section].getboolean(setting, fallback=fallback)
+            return self[section].getboolean(setting, fallback=fallback)
         except ValueError:
-            self[section][setting] = 'yes' if fallback else 'no'
-            value = fallback
+            log.warning('Invalid boolean value for %s: %r', setting,
+                        self[section][setting])
+            return fallback
 
-        return value
+    def read_int(self, setting, section='main', fallback=0):
+        try:
+            return self[section].getint(setting, fallback=fallback)
+        except ValueError:
+            log.warning('Invalid integer value for %s: %r', setting,
+                        self[section][setting])
+            return fallback
 
-    def save(self):
-        with open(self.filename, 'w', encoding='UTF-8') as config_file:
-            self.write(config_file)
+    def read_float(self, setting, section='main', fallback=0.0):
+        try:
+            return self[section].getfloat(setting, fallback=fallback)
+        except ValueError:
+            log.warning('Invalid number value for %s: %r', setting,
+                        self[section][setting])
+            return fallback
+
+    @contextlib.contextmanager
+    def transaction(self, background=False):
+        """Collects the settings changed with :meth:`write_setting` in the
+        ``with`` block, and writes them to the configuration file at once
+        when the block exits. Nested transactions are written by the
+        outermost one.
 
-    def write_bool(self, setting, value, section='main'):
+        If the block raises an exception, its changes are rolled back.
+        With `background=True`, the file is written in a separate thread.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._rollback()
+            raise
+        finally:
+            self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            self.commit(background=background)
+
+    def write_setting(self, setting, value, section='main',
+                      background=False):
+        """Changes `setting` in `section` to the string `value`, and writes
+        it to the configuration file, unless in a :meth:`transaction`.
+
+        With `background=True`, the file is written in a separate thread.
+        """
+        if not self.has_section(section):
+            self.add_section(section)
+        key = (section, setting)
+        if key not in self._original_values:
+            self._original_values[key] = self[section].get(setting, raw=True)
         self[section][setting] = value
-        self.save()
+        self._pending[key] = value
+
+        if self._transaction_depth == 0:
+            self.commit(background=background)
+
+    def write_bool(self, setting, value, section='main', background=False):
+        if isinstance(value, bool):
+            value = 'yes' if value else 'no'
+        self.write_setting(
+            setting, value, section=section, background=background,
+        )
+
+    def _rollback(self):
+        for (section, setting), value in self._original_values.items():
+            if value is None:
+                self.remove_option(section, setting)
+            else:
+                self[section][setting] = value
+        self._pending.clear()
+        self._original_values.clear()
+
+    def commit(self, background=False):
+        """Writes the pending setting changes to the configuration file.
+
+        Only the changed settings are written, on top of the file's current
+        content. This keeps changes made to the file by other programs,
+        like a text editor, since it was loaded.
+        """
+        if not self._pending:
+            return
+        changes = dict(self._pending)
+        self._pending.clear()
+        self._original_values.clear()
+
+        if background:
+            threading.Thread(
+                target=self._write_changes, args=(changes,),
+                name='uroute-config', daemon=False,
+            ).start()
+        else:
+            self._write_changes(changes)
+
+    def _write_changes(self, changes):
+        with self._write_lock, _locked(self.lock_path):
+            on_disk = ConfigParser(interpolation=None)
+            try:
+                with open(self.filename, encoding='UTF-8') as config_file:
+                    on_disk.read_file(config_file)
+            except FileNotFoundError:
+                pass
+            except (OSError, ConfigParserError) as exc:
+                log.warning(
+                    'Not saving settings %r: Unable to read %s: %s',
+                    sorted(changes), self.filename, exc,
+                )
+                return False
+
+            for (section, setting), value in changes.items():
+                if not on_disk.has_section(section):
+                    on_disk.add_section(section)
+                on_disk.set(section, setting, value)
+
+            try:
+                _write_atomic(self.filename, on_disk.write)
+            except OSError as exc:
+                log.warning('Unable to save %s: %s', self.filename, exc)
+                return False
+            log.debug('Saved %d settings to %s', len(changes), self.filename)
+            return True
+
+    def save(self):
+        """Atomically replaces the configuration file with the complete
+        in-memory configuration.
+        """
+        with self._write_lock, _locked(self.lock_path):
+            _write_atomic(self.filename, self.write)
@@ -1,11 +1,19 @@
 """Contains core logic in the `Uroute` class."""
 
+import atexit
 import logging
+import shlex
 import subprocess
+import threading
+import time
 from collections import namedtuple
 
-from uroute import url as u, xdgdesktop
+from uroute import trace, url as u, xdgdesktop
+from uroute.cache import LruCache
 from uroute.config import Config
+from uroute.executables import ExecutableCache
+from uroute.routing import Route, Router
+from uroute.util import spawn_detached
 
 
 Program = namedtuple('Program', ('name', 'command', 'icon'))
@@ -13,18 +21,33 @@ Program = namedtuple('Program', ('name', 'command', 'icon'))
 log = logging.getLogger(__name__)
 
 
-class Uroute:
+class Uroute:  # pylint: disable=too-many-instance-attributes
     """Main controller class."""
 
     def __init__(self, preferred_prog=None):
         self.default_program = None
         self.preferred_prog = preferred_prog
-        self.url_cleaning_rules = {}
+        self.url_cleaning_rules = None
+        self._rules_lock = threading.Lock()
+        self.unavailable_programs = set()
+        # `(cache, file path)` pairs, saved by `save_caches()`
+        self._persisted_caches = []
 
         # Load config
-        self.config = Config()
+        with trace.span('Config load'):
+            self.config = Config()
         self._init_logging()
+        self.executables = self._init_executables()
         self.programs = self._load_config_programs()
+        self.router = Router(
+            self.config.derive('routes', self._load_config_routes),
+        )
+        self.config.save_snapshot()
+        self.clean_url_cache = self._init_clean_url_cache()
+        self.unshortener = None
+        if self.config.read_bool('unshorten_urls', fallback=False):
+            self.unshortener = self.create_unshortener()
+        atexit.register(self.save_caches)
 
     def _init_logging(self):
         logging_config = {
@@ -37,7 +60,35 @@ class Uroute:
 
         logging.basicConfig(**logging_config)
 
-    def _load_config_programs(self):
+    def _persist_cache(self, cache, filename):
+        # Loads `cache` from `filename` in the XDG cache dir, and saves it
+        # there with the other caches.
+        cache_file = xdgdesktop.get_cache_file_path(filename)
+        cache.load(cache_file)
+        self._persisted_caches.append((cache, cache_file))
+        return cache
+
+    def save_caches(self):
+        """Saves the caches that are kept across Uroute runs.
+
+        Called on exit, or by :meth:`close`.
+        """
+        for cache, cache_file in self._persisted_caches:
+            cache.save(cache_file)
+
+    def close(self):
+        """Saves the caches and releases resources, for when this instance
+        is replaced by another.
+        """
+        atexit.unregister(self.save_caches)
+        self.save_caches()
+        if self.unshortener:
+            self.unshortener.close()
+
+    def _init_executables(self):
+        return self._persist_cache(ExecutableCache(), 'executables.cache')
+
+    def _parse_config_programs(self):
         programs = {}
         for section_name in self.config.sections():
             if not section_name.startswith('program:'):
@@ -55,6 +106,20 @@ class Uroute:
                 icon=section.get('icon'),
             )
 
+        return programs
+
+    @trace.traced()
+    def _load_config_programs(self):
+        programs = self.config.derive(
+            'programs', self._parse_config_programs,
+        )
+        for prog_id, program in programs.items():
+            if self.resolve_executable(program.command) is None:
+                log.warning(
+                    'Program %s not found: %s', prog_id, program.command,
+                )
+                self.unavailable_programs.add(prog_id)
+
         try:
             self.default_program = self.config['main']['default_program']
         except KeyError:
@@ -63,21 +128,179 @@ class Uroute:
 
         return programs
 
-    def clean_url(self, url):
+    def _load_config_routes(self):
+        routes = []
+        for section_name in self.config.sections():
+            if not section_name.startswith('route:'):
+                continue
+
+            name = section_name[len('route:'):]
+            section = self.config[section_name]
+            program = section.get('program')
+            if program not in self.programs:
+                log.warning(
+                    'Ignoring route %s to unknown program: %s', name, program,
+                )
+                continue
+
+            routes.append(Route(
+                name=name,
+                program=program,
+                hosts=section.get('hosts', '').split(),
+                regexes=[
+                    regex for regex in section.get('regexes', '').splitlines()
+                    if regex.strip()
+                ],
+                schemes=section.get('schemes', '').split(),
+            ))
+
+        return routes
+
+    def _init_clean_url_cache(self):
+        cache = LruCache(
+            self.config.read_int('clean_url_cache_size', fallback=1024),
+        )
+
+        if self.config.read_bool('persist_clean_url_cache', fallback=False):
+            self._persist_cache(cache, 'clean_urls.cache')
+
+        return cache
+
+    def create_unshortener(self):
+        """Creates an :class:`uroute.unshorten.Unshortener` from the
+        configuration, with its cache persisted in the XDG cache dir.
+        """
+        # Imported here, as asyncio and ssl are slow to import, and only
+        # needed when unshortening is enabled.
+        # pylint: disable=import-outside-toplevel
+        from uroute.unshorten import (
+            DEFAULT_TIMEOUT, SHORTENER_HOSTS, Unshortener,
+        )
+
+        cache = self._persist_cache(LruCache(10000), 'unshortened.cache')
+
+        hosts = set(SHORTENER_HOSTS)
+        hosts.update(
+            self.config['main'].get('unshorten_hosts', '').split(),
+        )
+        return Unshortener(
+            hosts=hosts,
+            timeout=self.config.read_float(
+                'unshorten_timeout', fallback=DEFAULT_TIMEOUT,
+            ),
+            cache=cache,
+        )
+
+    def _get_rules_file(self):
+        rules_file = self.config['main'].get('clean_urls_rules_file')
+        if not rules_file:
+            rules_file = xdgdesktop.get_data_file_path('rules.json')
+        return rules_file
+
+    @trace.traced()
+    def load_cleaning_rules(self):
+        """(Re)loads URL cleaning rules from the configured rules file.
+
+        Compiled rules are cached in ``$XDG_DATA_HOME/uroute/rules.cache``,
+        until the rules file changes.
+        """
+        rules_file = self._get_rules_file()
+        rules = u.load_cleaning_rules(
+            rules_file,
+            cache_path=xdgdesktop.get_data_file_path('rules.cache'),
+        )
+        rules.max_redirects = self.config.read_int(
+            'clean_urls_max_redirects', fallback=u.MAX_REDIRECTS,
+        )
+        self.url_cleaning_rules = rules
+        return self.url_cleaning_rules
+
+    def update_cleaning_rules(self):
+        """Updates loaded URL cleaning rules from the rules file, only
+        recompiling providers that were added or changed.
+
+        Rules are loaded from scratch if none were loaded yet. Returns a
+        :class:`uroute.url.RulesDiff`, or ``None`` if rules were loaded.
+        """
+        rules = self.url_cleaning_rules
+        if rules is None:
+            self.load_cleaning_rules()
+            return None
+
+        rules, diff = u.update_cleaning_rules(
+            rules, self._get_rules_file(),
+            cache_path=xdgdesktop.get_data_file_path('rules.cache'),
+        )
+        log.info('Updated URL cleaning rules: %s', diff)
+        if diff.changed:
+            log.debug('Changed providers: %s', ', '.join(diff.changed))
+        self.url_cleaning_rules = rules
+        return diff
+
+    def refresh_cleaning_rules(self):
+        """Checks for updated URL cleaning rules in a background thread.
+
+        The current rules are used until updated rules were downloaded,
+        after which they are swapped in by :meth:`update_cleaning_rules`.
+        """
+        return u.refresh_rules_in_background(
+            self._get_rules_file(), self.update_cleaning_rules,
+        )
+
+    def _rules_need_refresh(self):
+        max_age = self.config.read_float('clean_urls_rules_max_age')
+        if max_age <= 0:
+            return False
+
+        age = u.rules_data_age(self._get_rules_file())
+        return age is not None and age > max_age * 24 * 60 * 60
+
+    def apply_cleaning_rules(self, url):
         """Cleans the given URL with the configured rules data file.
 
         The value of ``config['main']['clean_urls_rules_file']`` must
         point to a valid JSON file, from which rule data will be read.
 
-        :seealso: :class:`uroute.url.UrlCleaner`
+        The rules are loaded and compiled on first use, and reused for
+        every subsequent call. Results are cached per URL and rules
+        version, in memory and, if ``persist_clean_url_cache`` is enabled,
+        in ``$XDG_CACHE_HOME/uroute``. If the rules file is older than
+        ``config['main']['clean_urls_rules_max_age']`` days, updated
+        rules are fetched in the background.
+
+        This is safe to call from any thread.
+
+        :seealso: :class:`uroute.url.CompiledRules`
         """
-        if not self.url_cleaning_rules:
-            rules_file = self.config['main'].get('clean_urls_rules_file')
-            if not rules_file:
-                rules_file = xdgdesktop.get_data_file_path('rules.json')
-            self.url_cleaning_rules = u.load_cleaning_rules(rules_file)
+        if self.url_cleaning_rules is None:
+            # Other threads wait for the first one to load the rules
+            with self._rules_lock:
+                if self.url_cleaning_rules is None:
+                    self.load_cleaning_rules()
+                    if self._rules_need_refresh():
+                        self.refresh_cleaning_rules()
+
+        rules = self.url_cleaning_rules
+        cache_key = (rules.fingerprint, url)
+        cleaned = self.clean_url_cache.get(cache_key)
+        if cleaned is None:
+            cleaned = rules.clean(url)
+            self.clean_url_cache.put(cache_key, cleaned)
+        return cleaned
 
-        return u.clean_url(self.url_cleaning_rules, url)
+    @trace.traced()
+    def clean_url(self, url):
+        """Cleans the given URL with :meth:`apply_cleaning_rules`.
+
+        If ``unshorten_urls`` is enabled, short URLs are then resolved
+        to their (cleaned) targets as well.
+        """
+        cleaned = self.apply_cleaning_rules(url)
+        if self.unshortener and self.unshortener.is_short_url(cleaned):
+            cleaned = self.unshortener.resolve_sync(
+                cleaned, clean=self.apply_cleaning_rules,
+            )
+        return cleaned
 
     def get_program(self, prog_id=None):
         if not self.programs:
@@ -100,22 +323,100 @@ class Uroute:
             raise ValueError(f'Unknown program ID: {prog_id}')
         return self.programs[prog_id]
 
+    def resolve_executable(self, command):
+        """Returns the absolute path of the executable that `command` runs,
+        or ``None`` if it can't be found.
+        """
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            return None
+        if not args:
+            return None
+        return self.executables.resolve(args[0])
+
+    def is_program_available(self, prog_id):
+        """Returns whether the executable of program `prog_id` was found."""
+        return prog_id not in self.unavailable_programs
+
+    def route(self, url):
+        """Returns the ID of the program that `url` is routed to by the
+        configured ``route:`` sections, or `None`.
+        """
+        route = self.router.route(url)
+        return route.program if route else None
+
+    def route_url(self, url):
+        """Looks up the program that `url` is routed to, and cleans it.
+
+        `url` is matched as is first, and then with the cleaning rules
+        applied, but without resolving short URLs. Without any configured
+        routes, nothing is cleaned, so that the window isn't held up.
+
+        Returns a ``(command, cleaned_url)`` tuple, ready for :meth:`run`,
+        or `None` if no route matches, or the routed program's executable
+        was not found.
+        """
+        if not self.router.routes:
+            return None
+        prog_id = self.route(url)
+        if prog_id is None:
+            prog_id = self.route(self.apply_cleaning_rules(url))
+        if prog_id is None:
+            return None
+        if not self.is_program_available(prog_id):
+            log.warning('Not routing to unavailable program %s', prog_id)
+            return None
+        return self.get_command(prog_id), self.clean_url(url)
+
     def get_command(self, program):
         if not isinstance(program, Program):
             program = self.get_program(program)
         return program.command
 
-    def run(self, command, url):
+    def run(self, command, url, wait=None):
+        """Runs `command` for `url`.
+
+        The URL replaces any ``@URL`` argument in `command`, or is
+        appended to it. The program is started detached, and this returns
+        immediately, unless `wait` is true. `wait` defaults to the
+        ``wait_for_program`` setting.
+        """
         log.debug('Routing URL %s to command: %s', url, command)
 
         run_args = [
-            arg == '@URL' and url or arg for arg in command.split()
+            url if arg == '@URL' else arg for arg in shlex.split(command)
         ]
 
         if url not in run_args:
             run_args.append(url)
 
-        subprocess.run(run_args, check=False)
+        # Skip the $PATH scan if the executable was resolved before
+        executable = self.executables.resolve(run_args[0])
+        if executable is not None:
+            run_args[0] = executable
+
+        if wait is None:
+            wait = self.config.read_bool('wait_for_program', fallback=False)
+        if wait:
+            subprocess.run(run_args, check=False)
+            return
+
+        start = time.perf_counter()
+        with trace.span('Uroute.run spawn'):
+            pid = spawn_detached(run_args)
+        log.debug(
+            'Spawned %r as PID %d in %.1f ms',
+            run_args, pid, (time.perf_counter() - start) * 1000,
+        )
+
+    def is_default_browser(self):
+        """Returns whether Uroute is the current user's default browser."""
+        try:
+            return xdgdesktop.get_default_browser() == 'uroute.desktop'
+        except FileNotFoundError as exc:
+            log.warning('Command not found %s', exc)
+            return False
 
     def set_as_default_browser(self):
         """Installs Uroute as the default browser for the current user."""
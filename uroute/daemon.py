@@ -0,0 +1,214 @@
+"""Resident Uroute process, that shows its window for URLs sent to it.
+
+The daemon keeps a :class:`uroute.core.Uroute` controller, its compiled
+cleaning rules and a hidden, fully built window in memory. Other
+``uroute`` invocations only hand their URL over a Unix socket and exit,
+instead of loading all of that themselves.
+
+The protocol is a single line of JSON per connection, sent by the client
+(``{"url": ..., "program": ..., "ask": ...}``), answered by ``ok`` from the
+daemon.
+"""
+
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+
+from uroute import xdgdesktop
+
+log = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 1  # seconds
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+def get_socket_path():
+    return xdgdesktop.get_runtime_file_path('uroute.sock')
+
+
+def send_url(url, program=None, ask=False, socket_path=None):
+    """Asks a running daemon to route `url`.
+
+    The daemon shows its window, unless `url` matches a configured route
+    and `ask` is false.
+
+    Returns `False` if no daemon is running.
+    """
+    if socket_path is None:
+        socket_path = get_socket_path()
+    request = json.dumps({'url': url, 'program': program, 'ask': ask}) + '\n'
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(socket_path)
+            sock.sendall(request.encode('UTF-8'))
+            response = sock.makefile('rb').readline()
+    except OSError as exc:
+        log.debug('No Uroute daemon at %s: %s', socket_path, exc)
+        return False
+
+    if response.strip() != b'ok':
+        log.warning('Unexpected response from Uroute daemon: %r', response)
+        return False
+    log.debug('URL handed to Uroute daemon: %s', url)
+    return True
+
+
+def read_request(conn):
+    """Reads and parses a client request from socket `conn`."""
+    conn.settimeout(CONNECT_TIMEOUT)
+    line = conn.makefile('rb').readline(MAX_REQUEST_SIZE)
+    request = json.loads(line.decode('UTF-8'))
+    if not isinstance(request, dict):
+        raise ValueError(f'Invalid request: {request!r}')
+    return (
+        request.get('url'), request.get('program'),
+        bool(request.get('ask')),
+    )
+
+
+def bind_socket(socket_path):
+    """Returns a listening socket at `socket_path`.
+
+    Raises `RuntimeError` if another daemon is already listening there.
+    """
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                # Left behind by a daemon that did not exit cleanly
+                os.remove(socket_path)
+            else:
+                raise RuntimeError(
+                    f'Uroute daemon already running at {socket_path}',
+                )
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        sock.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    sock.listen(5)
+    return sock
+
+
+class Daemon:  # pylint: disable=too-few-public-methods
+    """Serves requests from :func:`send_url` in the GTK main loop."""
+
+    def __init__(self, socket_path=None):
+        if socket_path is None:
+            socket_path = get_socket_path()
+        self.socket_path = socket_path
+        self.sock = None
+        self.gui = None
+        self.config_mtime = None
+
+    def _load(self):
+        # pylint: disable=import-outside-toplevel
+        from uroute.core import Uroute
+        from uroute.gui import UrouteGui
+
+        if self.gui is not None:
+            # So that the new instance loads the current caches
+            self.gui.uroute.save_caches()
+        uroute = Uroute()
+        # Loading the cleaning rules is slow, so get it out of the way
+        uroute.load_cleaning_rules()
+        gui = UrouteGui(uroute, resident=True)
+        if self.gui is not None:
+            self.gui.destroy()
+            self.gui.uroute.close()
+        self.gui = gui
+        self.config_mtime = self._get_config_mtime(uroute)
+        log.debug('Uroute daemon loaded')
+
+    @staticmethod
+    def _get_config_mtime(uroute):
+        try:
+            return os.path.getmtime(uroute.config.filename)
+        except OSError:
+            return None
+
+    def _on_connection(self, _source, _condition):
+        conn, _address = self.sock.accept()
+        with conn:
+            try:
+                url, program, ask = read_request(conn)
+                conn.sendall(b'ok\n')
+            except (OSError, ValueError) as exc:
+                log.warning('Invalid Uroute daemon request: %s', exc)
+                return True
+
+        # An exception would make GLib stop watching the socket
+        try:
+            self._handle_request(url, program, ask)
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Unable to handle Uroute daemon request:')
+        return True  # Keep watching the socket
+
+    def _handle_request(self, url, program, ask):
+        if self._get_config_mtime(self.gui.uroute) != self.config_mtime:
+            log.info('Configuration changed, reloading')
+            try:
+                self._load()
+            except Exception:  # pylint: disable=broad-except
+                # Keep serving with the previous configuration
+                log.exception('Unable to reload configuration:')
+        if not url or ask:
+            self.gui.present_url(url, program)
+            return
+
+        # Cleaning may download rules and resolve short URLs, so route in
+        # another thread, to keep the main loop responsive.
+        from uroute.gui import GLib  # pylint: disable=import-outside-toplevel
+        uroute = self.gui.uroute
+
+        def route():
+            try:
+                routed = uroute.route_url(url)
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Unable to route URL %s:', url)
+                routed = None
+            GLib.idle_add(self._on_routed, uroute, url, program, routed)
+
+        threading.Thread(target=route, name='uroute-route', daemon=True) \
+            .start()
+
+    def _on_routed(self, uroute, url, program, routed):
+        try:
+            if routed:
+                uroute.run(*routed, wait=False)
+            else:
+                self.gui.present_url(url, program)
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Unable to open URL %s:', url)
+        return False  # Don't repeat
+
+    def run(self):
+        """Loads everything and serves requests until killed."""
+        # pylint: disable=import-outside-toplevel
+        from uroute.gui import GLib, Gtk, Notify
+
+        self.sock = bind_socket(self.socket_path)
+        try:
+            self._load()
+            GLib.io_add_watch(
+                self.sock.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN,
+                self._on_connection,
+            )
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                GLib.unix_signal_add(
+                    GLib.PRIORITY_DEFAULT, signum, Gtk.main_quit,
+                )
+            Notify.init('uroute')
+            log.info('Uroute daemon listening on %s', self.socket_path)
+            Gtk.main()
+        finally:
+            self.sock.close()
+            os.remove(self.socket_path)
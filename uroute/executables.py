@@ -0,0 +1,85 @@
+"""Resolution of program executables in ``$PATH``, cached across runs."""
+
+import logging
+import os
+
+from uroute.__version__ import VERSION
+from uroute.util import load_pickle, mtime_ns, save_pickle_atomic
+
+log = logging.getLogger(__name__)
+
+
+def _is_executable(path):
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+class ExecutableCache:
+    """Resolves program names to absolute executable paths, like
+    :func:`shutil.which`, remembering the results.
+
+    A found executable stays valid while its mtime is unchanged. A missing
+    one stays missing while the mtimes of the ``$PATH`` directories are
+    unchanged, as adding a file to a directory updates its mtime. The
+    cache is only valid for the ``$PATH`` it was created with.
+    """
+
+    def __init__(self, path_env=None):
+        if path_env is None:
+            path_env = os.environ.get('PATH', os.defpath)
+        self.path_env = path_env
+        self.path_dirs = [d for d in path_env.split(os.pathsep) if d]
+        self.modified = False
+        self._entries = {}
+
+    def _path_stamp(self):
+        return tuple(mtime_ns(path_dir) for path_dir in self.path_dirs)
+
+    def _is_valid(self, entry):
+        exe_path, stamp = entry
+        if exe_path is None:
+            return stamp == self._path_stamp()
+        return stamp == mtime_ns(exe_path) and _is_executable(exe_path)
+
+    def _lookup(self, name):
+        if os.path.dirname(name):
+            exe_path = os.path.abspath(os.path.expanduser(name))
+            if _is_executable(exe_path):
+                return exe_path, mtime_ns(exe_path)
+            return None, self._path_stamp()
+
+        # Stamp the directories before scanning them, so that a file added
+        # during the scan invalidates the entry.
+        stamp = self._path_stamp()
+        for path_dir in self.path_dirs:
+            exe_path = os.path.join(path_dir, name)
+            if _is_executable(exe_path):
+                return exe_path, mtime_ns(exe_path)
+        return None, stamp
+
+    def resolve(self, name):
+        """Returns the absolute path of executable `name`, or ``None`` if
+        it can't be found.
+        """
+        entry = self._entries.get(name)
+        if entry is None or not self._is_valid(entry):
+            entry = self._entries[name] = self._lookup(name)
+            self.modified = True
+        return entry[0]
+
+    def load(self, path):
+        """Adds the entries saved to `path` by :meth:`save`.
+
+        Caches saved by a different version of Uroute, or with a different
+        ``$PATH``, are ignored.
+        """
+        entries = load_pickle(path, (VERSION, self.path_env))
+        if entries is None:
+            return
+        self._entries.update(entries)
+        log.debug('Loaded %d executables from %r', len(entries), path)
+
+    def save(self, path):
+        """Atomically saves the cache to `path`, if modified."""
+        if self.modified and save_pickle_atomic(
+                path, (VERSION, self.path_env), self._entries):
+            self.modified = False
@@ -1,12 +1,19 @@
 """Everything GUI-related."""
 
+import contextlib
+import hashlib
 import logging
+import os
+import shlex
+import threading
 from collections import namedtuple
 
 import gi
 
-from uroute.url import extract_url
-from uroute.util import listify
+from uroute import trace, xdgdesktop
+from uroute.search import ProgramIndex
+from uroute.url import extract_urls
+from uroute.util import create_temp_file, listify
 
 gi.require_version('Gdk', '3.0')
 gi.require_version('Gtk', '3.0')
@@ -16,22 +23,104 @@ from gi.repository import Gdk, GdkPixbuf, GLib, Gtk, Notify, Pango
 
 log = logging.getLogger(__name__)
 
+ICON_SIZE = 64
+MAX_CLIPBOARD_URLS = 20
+CLEAN_PREVIEW_DELAY_MS = 300
+
 NotificationAction = namedtuple(
     'NotificationAction', ('id', 'label', 'callback', 'user_data'),
 )
 
 
-def get_clipboard_url():
-    """Returns URL from clipboard content, or `None`."""
-    clipboard = getattr(get_clipboard_url, '_clipboard', None)
+def _icon_cache_path(filename):
+    stat = os.stat(filename)
+    key = f'{os.path.abspath(filename)}:{stat.st_mtime_ns}:{ICON_SIZE}'
+    return xdgdesktop.get_cache_file_path(os.path.join(
+        'icons', hashlib.sha1(key.encode('UTF-8')).hexdigest() + '.png',
+    ))
+
+
+def load_icon_file(filename):
+    """Loads the image in `filename`, scaled down to fit in `ICON_SIZE`.
+
+    Scaled icons are cached as PNG files in ``$XDG_CACHE_HOME/uroute/icons``,
+    keyed on `filename` and its modification time. This is safe to call
+    from any thread.
+
+    Returns `None` if the icon could not be loaded.
+    """
+    try:
+        cache_path = _icon_cache_path(filename)
+    except OSError as exc:
+        log.warning('Unable to load icon from %s: %s', filename, exc)
+        return None
+
+    if os.path.isfile(cache_path):
+        try:
+            return GdkPixbuf.Pixbuf.new_from_file(cache_path)
+        except GLib.Error as exc:
+            log.debug('Ignoring cached icon %s: %s', cache_path, exc)
+
+    try:
+        _format, width, height = GdkPixbuf.Pixbuf.get_file_info(filename)
+        if width <= ICON_SIZE and height <= ICON_SIZE:
+            icon = GdkPixbuf.Pixbuf.new_from_file(filename)
+        else:
+            icon = GdkPixbuf.Pixbuf.new_from_file_at_scale(
+                filename, ICON_SIZE, ICON_SIZE, True,
+            )
+    except GLib.Error as exc:
+        log.warning('Unable to load icon from %s: %s', filename, exc)
+        return None
+
+    tmp_path = None
+    try:
+        tmp_path = create_temp_file(cache_path)
+        icon.savev(tmp_path, 'png', [], [])
+        os.replace(tmp_path, cache_path)
+    except (GLib.Error, OSError) as exc:
+        log.debug('Unable to cache icon %s: %s', filename, exc)
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+    return icon
+
+
+def _command_executable(command):
+    try:
+        return os.path.basename(shlex.split(command)[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _get_browser_icons():
+    # Maps installed browsers' executable names to their icon files
+    icons = {}
+    for entry in xdgdesktop.find_browsers():
+        icon_file = xdgdesktop.get_icon_path(entry.icon, ICON_SIZE)
+        if icon_file:
+            icons.setdefault(_command_executable(entry.command), icon_file)
+    return icons
+
+
+def get_clipboard_urls():
+    """Returns the distinct URLs in the clipboard content, at most
+    `MAX_CLIPBOARD_URLS` of them.
+    """
+    clipboard = getattr(get_clipboard_urls, '_clipboard', None)
     if clipboard is None:
         clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
         # pylint: disable=protected-access
-        get_clipboard_url._clipboard = clipboard
+        get_clipboard_urls._clipboard = clipboard
     contents = clipboard.wait_for_text()
+    urls = []
     if contents:
-        return extract_url(contents)
-    return None
+        for url in extract_urls(contents):
+            if url not in urls:
+                urls.append(url)
+                if len(urls) >= MAX_CLIPBOARD_URLS:
+                    break
+    return urls
 
 
 def notify(  # pylint: disable=too-many-arguments
@@ -63,19 +152,32 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
     functionality.
     """
 
-    def __init__(self, uroute):
+    def __init__(self, uroute, resident=False):
+        """With `resident=True`, the window is hidden instead of quitting
+        the GTK main loop when done, and the selected command is run
+        directly. See :mod:`uroute.daemon`.
+        """
         super().__init__()
         self.uroute = uroute
+        self.resident = resident
         self.command = None
         self.orig_url = None
+        # Identifies the latest cleaning request, so that results of
+        # earlier ones can be discarded.
+        self._clean_request = 0
+        self._cleaning_url = None
+        # Whether to run the command once the URL is cleaned
+        self._run_pending = False
+        self._preview_source = None
+        self._shown = False
+        self._icons_requested = set()
+        self._icons_queued = False
+        self._shown_matches = None
 
         self._build_ui()
 
     def run(self, url):
-        self.set_url(url)
-        self._check_clipboard_url()
-        self.show_all()
-        self._check_default_browser()
+        self.present_url(url)
 
         Notify.init('uroute')
         Gtk.main()
@@ -85,22 +187,67 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
 
         return (self.command, self.url)
 
+    def present_url(self, url, prog_id=None):
+        """Shows the window for routing `url`.
+
+        If `prog_id` is given, that program is selected instead of the
+        default program.
+        """
+        self.command = None
+        self.url_combo.remove_all()
+        self._clear_search()
+        self.select_program(prog_id)
+        self.set_url(url)
+        self._check_clipboard_url()
+        self.show_all()
+        self.present()
+        GLib.idle_add(self._check_default_browser)
+
+    def select_program(self, prog_id=None):
+        """Selects the program with ID `prog_id`, or the default program."""
+        try:
+            program = self.uroute.get_program(prog_id)
+        except ValueError as exc:
+            log.warning(str(exc))
+            return
+
+        for row in self.browser_filter:
+            if row[3] is program:
+                log.debug('Selecting program: %r', program.command)
+                self.iconview.select_path(row.path)
+                self.iconview.scroll_to_path(row.path, False, 0, 0)
+                self._on_browser_icon_selected(self.iconview)
+                return
+
     @property
     def url(self):
         return self.url_entry.get_text()
 
     def set_url(self, url, clean=True):
-        """Sets the given URL in the GUI field, after cleaning it."""
+        """Sets the given URL in the GUI field.
+
+        With `clean=True`, the URL is cleaned in a background thread, and
+        replaced by the cleaned URL when that's done, unless it was edited
+        in the meantime.
+        """
         self.orig_url = None
+        self._set_run_pending(False)
 
         if not url and not isinstance(url, str):
             url = ''
 
+        self._show_url(url)
         if url and clean:
-            cleaned_url = self.uroute.clean_url(url)
-            if cleaned_url != url:
-                self.orig_url = url
-                url = cleaned_url
+            self._cleaning_url = url
+            self._clean_url_in_background(url, self._on_url_cleaned)
+        else:
+            self._clean_request += 1  # Discard pending results
+        return url
+
+    def _show_url(self, url, orig_url=None):
+        self.orig_url = orig_url
+        self._cancel_clean_preview()
+        self.clean_preview_label.hide()
 
         if self.orig_url:
             self.clean_url_btn.hide()
@@ -113,12 +260,77 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
             self.clean_url_btn.show()
             self.restore_url_btn.hide()
 
-        self.url_entry.set_text(url)
-        return url
+        # Don't preview cleaning of URLs that weren't typed
+        with self.url_entry.handler_block(self._url_changed_handler):
+            self.url_entry.set_text(url)
+
+    def _clean_url_in_background(self, url, callback):
+        """Cleans `url` in a separate thread, and then calls
+        ``callback(url, cleaned_url)`` from the main loop.
+
+        Only the latest request's callback is called.
+        """
+        self._clean_request += 1
+        request = self._clean_request
+
+        def done(cleaned_url):
+            if request == self._clean_request:
+                callback(url, cleaned_url)
+            else:
+                log.debug('Discarding stale cleaning result for %s', url)
+            return False  # Don't repeat
+
+        def clean():
+            try:
+                cleaned_url = self.uroute.clean_url(url)
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Unable to clean URL %s:', url)
+                cleaned_url = url
+            GLib.idle_add(done, cleaned_url)
+
+        threading.Thread(target=clean, name='uroute-clean', daemon=True) \
+            .start()
+
+    def _on_url_cleaned(self, url, cleaned_url):
+        self._cleaning_url = None
+        if self.url != url:
+            return  # Edited in the meantime
+        if cleaned_url != url:
+            self._show_url(cleaned_url, orig_url=url)
+        if self._run_pending:
+            self._on_run_clicked(None)
+
+    def _set_run_pending(self, pending):
+        self._run_pending = pending
+        self.run_btn.set_sensitive(not pending)
+
+    def _cancel_clean_preview(self):
+        if self._preview_source is not None:
+            GLib.source_remove(self._preview_source)
+            self._preview_source = None
+
+    def _start_clean_preview(self):
+        self._preview_source = None
+        url = self.url
+        if url:
+            self._clean_url_in_background(url, self._on_clean_preview)
+        return False  # Don't repeat
+
+    def _on_clean_preview(self, url, cleaned_url):
+        if self.url != url or cleaned_url == url:
+            self.clean_preview_label.hide()
+            return
+        self.clean_preview_label.set_markup(
+            f'Cleaned: <tt>{GLib.markup_escape_text(cleaned_url)}</tt>',
+        )
+        self.clean_preview_label.show()
 
     # UTILITY METHODS #
     def _check_default_browser(self):
-        if self.uroute.config.read_bool('ask_default_browser'):
+        # Called from an idle callback, to keep it out of the way of showing
+        # the window.
+        if self.uroute.config.read_bool('ask_default_browser') \
+                and not self.uroute.is_default_browser():
             def set_default_browser(notif, _action, _user_data):
                 notif.close()
                 if self.uroute.set_as_default_browser():
@@ -127,7 +339,9 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
                         'Uroute is now configured as your default browser.',
                     )
                     # Don't ask again
-                    self.uroute.config.write_bool('ask_default_browser', 'no')
+                    self.uroute.config.write_bool(
+                        'ask_default_browser', 'no', background=True,
+                    )
                 else:
                     notify(
                         'Unable to configure Uroute as your default browser',
@@ -140,7 +354,9 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
                 log.debug("Don't set as default browser")
                 notif.close()
                 # Don't ask again
-                self.uroute.config.write_bool('ask_default_browser', 'no')
+                self.uroute.config.write_bool(
+                    'ask_default_browser', 'no', background=True,
+                )
 
             notify(
                 'Set as default browser?',
@@ -158,34 +374,98 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
                 ],
                 urgency=Notify.Urgency.CRITICAL,
             )
+        return False  # Don't repeat
 
     def _check_clipboard_url(self):
         if not self.url \
                 and self.uroute.config.read_bool('read_url_from_clipboard'):
-            clipboard_url = get_clipboard_url()
-            if clipboard_url:
-                self.set_url(clipboard_url)
-                notify(
-                    'Using URL from clipboard', clipboard_url, transient=True,
+            clipboard_urls = get_clipboard_urls()
+            if clipboard_urls:
+                # Offer the other URLs in the URL entry's drop-down
+                for url in clipboard_urls:
+                    self.url_combo.append_text(url)
+                self.set_url(clipboard_urls[0])
+                message = clipboard_urls[0]
+                if len(clipboard_urls) > 1:
+                    message += f' (and {len(clipboard_urls) - 1} more)'
+                notify('Using URL from clipboard', message, transient=True)
+
+    def _queue_visible_icons(self, *_args):
+        if not self._icons_queued:
+            self._icons_queued = True
+            GLib.idle_add(self._load_visible_icons)
+
+    def _load_visible_icons(self):
+        """Loads the icons of the programs that are currently scrolled into
+        view, and not filtered out, if not loaded yet.
+        """
+        self._icons_queued = False
+        visible_range = self.iconview.get_visible_range()
+        if not visible_range:
+            return False  # Not shown yet
+        start, end = visible_range
+
+        rows = []
+        tree_iter = self.browser_filter.get_iter(start)
+        while tree_iter is not None:
+            store_iter = self.browser_filter.convert_iter_to_child_iter(
+                tree_iter,
+            )
+            prog_id = self.browser_store.get_value(store_iter, 5)
+            if prog_id not in self._icons_requested:
+                self._icons_requested.add(prog_id)
+                rows.append(
+                    (store_iter, self.browser_store.get_value(store_iter, 3)),
                 )
-
-    def _load_program_icon(self, program):
-        icon = None
-        if program.icon:
-            icon = Gtk.Image.new_from_file(program.icon).get_pixbuf()
-            if icon is None:
-                log.warning('Unable to load icon from %s', program.icon)
-            else:
-                if icon.get_width() > 64 or icon.get_height() > 64:
-                    icon = icon.scale_simple(
-                        64, 64, GdkPixbuf.InterpType.BILINEAR,
+            if self.browser_filter.get_path(tree_iter).compare(end) >= 0:
+                break
+            tree_iter = self.browser_filter.iter_next(tree_iter)
+
+        self._load_program_icons(rows)
+        return False  # Don't repeat
+
+    def _load_program_icons(self, rows):
+        """Loads the icons of `rows`' programs in a background thread.
+
+        `rows` are ``(tree_iter, program)`` pairs. Each loaded icon
+        replaces the placeholder in its row from the main loop. Programs
+        without a configured icon use the icon of the installed browser
+        with the same executable, if any.
+        """
+        def set_icon(tree_iter, icon):
+            self.browser_store.set_value(tree_iter, 0, icon)
+            return False  # Don't repeat
+
+        @trace.traced('load program icons')
+        def load_icons():
+            browser_icons = None
+            for tree_iter, program in rows:
+                icon_file = program.icon
+                if not icon_file:
+                    if browser_icons is None:
+                        browser_icons = _get_browser_icons()
+                    icon_file = browser_icons.get(
+                        _command_executable(program.command),
                     )
+                icon = icon_file and load_icon_file(icon_file)
+                if icon is not None:
+                    GLib.idle_add(set_icon, tree_iter, icon)
 
-        if icon is None:
-            icon = Gtk.IconTheme.get_default().load_icon(
-                'help-about', 64, 0,
-            )
-        return icon
+        if rows:
+            threading.Thread(
+                target=load_icons, name='uroute-icons', daemon=True,
+            ).start()
+
+    def _close(self):
+        self._set_run_pending(False)
+        self.hide()
+        if not self.resident:
+            Gtk.main_quit()
+            return
+
+        if self.command:
+            self.uroute.run(self.command, self.url, wait=False)
+        self.command = None
 
     # UI BUILDING METHODS #
     def _build_ui(self):
@@ -194,7 +474,10 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
         self.set_border_width(10)
         self.set_default_size(860, 600)
         self.connect('show', self._on_window_show)
-        self.connect('destroy', self._on_cancel_clicked)
+        if self.resident:
+            self.connect('delete-event', self._on_delete_event)
+        else:
+            self.connect('destroy', self._on_cancel_clicked)
         self.connect('key-press-event', self._on_key_pressed)
 
         vbox = Gtk.VBox(spacing=6)
@@ -213,7 +496,10 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
         url_entry_hbox = Gtk.HBox()
 
         # pylint: disable=attribute-defined-outside-init
-        self.url_entry = Gtk.Entry()
+        self.url_combo = Gtk.ComboBoxText.new_with_entry()
+        self.url_combo.connect('changed', self._on_url_combo_changed)
+        # pylint: disable=attribute-defined-outside-init
+        self.url_entry = self.url_combo.get_child()
         self.url_entry.modify_font(Pango.FontDescription('monospace'))
 
         # pylint: disable=attribute-defined-outside-init
@@ -223,44 +509,82 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
         self.restore_url_btn = Gtk.Button.new_with_label('Restore')
         self.restore_url_btn.connect('clicked', self._on_restore_orig_url)
 
-        url_entry_hbox.pack_start(self.url_entry, True, True, 5)
+        # pylint: disable=attribute-defined-outside-init
+        self._url_changed_handler = self.url_entry.connect(
+            'changed', self._on_url_entry_changed,
+        )
+
+        # pylint: disable=attribute-defined-outside-init
+        self.clean_preview_label = Gtk.Label(xalign=0)
+        self.clean_preview_label.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+        self.clean_preview_label.set_selectable(True)
+        self.clean_preview_label.set_no_show_all(True)
+
+        url_entry_hbox.pack_start(self.url_combo, True, True, 5)
         url_entry_hbox.pack_start(self.clean_url_btn, False, False, 0)
         url_entry_hbox.pack_start(self.restore_url_btn, False, False, 0)
 
-        return url_entry_hbox
+        url_entry_vbox = Gtk.VBox(spacing=2)
+        url_entry_vbox.pack_start(url_entry_hbox, False, False, 0)
+        url_entry_vbox.pack_start(self.clean_preview_label, False, False, 5)
+        return url_entry_vbox
 
+    @trace.traced()
     def _build_browser_buttons(self):
+        # Columns: icon, label, command, program, tooltip, program ID
         # pylint: disable=attribute-defined-outside-init
-        self.browser_store = Gtk.ListStore(GdkPixbuf.Pixbuf, str, str, object)
-        iconview = Gtk.IconView.new()
-        iconview.set_model(self.browser_store)
+        self.browser_store = Gtk.ListStore(
+            GdkPixbuf.Pixbuf, str, str, object, str, str,
+        )
+        # pylint: disable=attribute-defined-outside-init
+        self.program_index = ProgramIndex(self.uroute.programs)
+        # pylint: disable=attribute-defined-outside-init
+        self.browser_filter = self.browser_store.filter_new()
+        self.browser_filter.set_visible_func(self._is_program_visible)
+        # pylint: disable=attribute-defined-outside-init
+        self.iconview = iconview = Gtk.IconView.new()
+        iconview.set_model(self.browser_filter)
         iconview.set_pixbuf_column(0)
         iconview.set_text_column(1)
+        iconview.set_tooltip_column(4)
         iconview.connect('item-activated', self._on_browser_icon_activated)
         iconview.connect('selection-changed', self._on_browser_icon_selected)
 
-        default_itr = None
-        default_program = self.uroute.get_program()
-
-        for program in self.uroute.programs.values():
-            itr = self.browser_store.append([
-                self._load_program_icon(program), program.name,
-                program.command, program,
-            ])
-            if program is default_program:
-                log.debug(
-                    'Selecting default program: %r',
-                    self.browser_store.get_value(itr, 2),
-                )
-                default_itr = itr
-
-        if default_itr:
-            iconview.select_path(self.browser_store.get_path(default_itr))
-            self._on_browser_icon_selected(iconview)
+        icon_theme = Gtk.IconTheme.get_default()
+        placeholder = icon_theme.load_icon('help-about', ICON_SIZE, 0)
+        missing = icon_theme.load_icon('dialog-warning', ICON_SIZE, 0)
+        for prog_id, program in self.uroute.programs.items():
+            if self.uroute.is_program_available(prog_id):
+                self.browser_store.append([
+                    placeholder, program.name, program.command, program,
+                    program.command, prog_id,
+                ])
+            else:
+                self._icons_requested.add(prog_id)
+                self.browser_store.append([
+                    missing, f'{program.name} (not found)', program.command,
+                    program, f'Program not found: {program.command}',
+                    prog_id,
+                ])
+        self.select_program()
 
         scroll = Gtk.ScrolledWindow()
         scroll.add(iconview)
-        return scroll
+        # Icons are only loaded once scrolled into view
+        scroll.get_vadjustment().connect(
+            'value-changed', self._queue_visible_icons,
+        )
+        iconview.connect('size-allocate', self._queue_visible_icons)
+
+        # pylint: disable=attribute-defined-outside-init
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text('Type to search programs')
+        self.search_entry.connect('search-changed', self._on_search_changed)
+
+        vbox = Gtk.VBox(spacing=6)
+        vbox.pack_start(self.search_entry, False, False, 0)
+        vbox.pack_start(scroll, True, True, 0)
+        return vbox
 
     def _build_command_hbox(self):
         # pylint: disable=attribute-defined-outside-init
@@ -271,9 +595,10 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
     def _build_button_toolbar(self):
         hbox = Gtk.Box(spacing=6)
 
-        button = Gtk.Button.new_with_mnemonic('Run')
-        button.connect('clicked', self._on_run_clicked)
-        hbox.pack_end(button, False, False, 0)
+        # pylint: disable=attribute-defined-outside-init
+        self.run_btn = Gtk.Button.new_with_mnemonic('Run')
+        self.run_btn.connect('clicked', self._on_run_clicked)
+        hbox.pack_end(self.run_btn, False, False, 0)
 
         button = Gtk.Button.new_with_label('Cancel')
         button.connect('clicked', self._on_cancel_clicked)
@@ -295,29 +620,91 @@ class UrouteGui(Gtk.Window):  # pylint: disable=too-many-instance-attributes
 
         self.command_entry.set_text(model.get_value(sel_iter, 2))
 
+    def _is_program_visible(self, model, tree_iter, _data):
+        return model.get_value(tree_iter, 5) in self.program_index.matches
+
+    def _clear_search(self):
+        self.search_entry.set_text('')
+        # Don't wait for the search entry's delayed signal
+        self._on_search_changed(self.search_entry)
+
+    def _on_search_changed(self, entry):
+        matches = self.program_index.search(entry.get_text())
+        if matches is self._shown_matches:
+            return  # Unchanged, e.g. after _clear_search()
+        self._shown_matches = matches
+        self.browser_filter.refilter()
+
+        # Keep a visible program selected
+        selected = self.iconview.get_selected_items()
+        first = self.browser_filter.get_iter_first()
+        if not selected and first is not None:
+            path = self.browser_filter.get_path(first)
+            self.iconview.select_path(path)
+            self.iconview.scroll_to_path(path, False, 0, 0)
+        self._queue_visible_icons()
+
     def _on_cancel_clicked(self, _button):
         self.command = None
-        self.hide()
-        Gtk.main_quit()
+        self._close()
+
+    def _on_delete_event(self, _window, _event):
+        self._on_cancel_clicked(None)
+        return True  # Keep the resident window around
 
     def _on_clean_url_clicked(self, _button):
         self.set_url(self.url, clean=True)
 
+    def _on_url_entry_changed(self, _entry):
+        if self.url_combo.get_active() >= 0:
+            return  # Picked from the drop-down, and cleaned by set_url
+        # Preview cleaning of the typed URL once typing pauses
+        self._cancel_clean_preview()
+        self._clean_request += 1  # Discard pending results
+        # Run the typed URL as is
+        self._set_run_pending(False)
+        self.clean_preview_label.hide()
+        self._preview_source = GLib.timeout_add(
+            CLEAN_PREVIEW_DELAY_MS, self._start_clean_preview,
+        )
+
+    def _on_url_combo_changed(self, combo):
+        # Only handle URLs picked from the drop-down, not typing
+        if combo.get_active() >= 0:
+            self.set_url(combo.get_active_text())
+
     def _on_restore_orig_url(self, _button):
         self.set_url(self.orig_url, clean=False)
 
     def _on_run_clicked(self, _button):
+        if self._cleaning_url is not None and self._cleaning_url == self.url:
+            # Don't open the URL before it's cleaned, but don't block the
+            # main loop waiting for it either: run once it's cleaned.
+            self._set_run_pending(True)
+            return
         self.command = self.command_entry.get_text()
-        self.hide()
-        Gtk.main_quit()
+        self._close()
 
     def _on_key_pressed(self, _wnd, event):
         if event.keyval == Gdk.KEY_Escape:
+            if self.search_entry.get_text():
+                self._clear_search()
+                return True
             self._on_cancel_clicked(None)
         if event.keyval == Gdk.KEY_Return:
             self._on_run_clicked(None)
+            return True
+        # Type-ahead: send typing in the program list to the search entry
+        if self.get_focus() is self.iconview:
+            return self.search_entry.handle_event(event)
+        return False
 
     def _on_window_show(self, _window):
+        if not self._shown:
+            self._shown = True
+            trace.mark('window shown')
+            trace.stop_profile()
+
         # Hack required because gtk
         self.clean_url_btn.set_visible(not self.orig_url)
         self.restore_url_btn.set_visible(bool(self.orig_url))
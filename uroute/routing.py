@@ -0,0 +1,196 @@
+"""Choosing a program for a URL, based on configured routes.
+
+Each route maps URLs to a program, by any of:
+
+* host globs: ``example.com`` matches only that host, ``*.example.com``
+  matches all of its subdomains. These are looked up in a trie of
+  reversed host labels, so matching doesn't slow down as hosts are
+  added. Other globs, like ``intranet*.example.com``, are matched as
+  regexes.
+* regexes, matched against the start of the full URL.
+* URL schemes, like ``mailto``.
+
+All regexes are combined into a single regex, except those with
+backreferences, which are matched separately. When multiple routes match
+a URL, the first configured route wins.
+"""
+
+import logging
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from uroute.util import has_backreference
+
+log = logging.getLogger(__name__)
+
+Route = namedtuple('Route', ('name', 'program', 'hosts', 'regexes', 'schemes'))
+
+# Matches a URL up to its host, and the end of the host
+_URL_PREFIX_RE = r'[a-z][a-z0-9+.-]*://(?:[^/?#@]*@)?'
+_HOST_END_RE = r'\.?(?::[0-9]*)?(?:[/?#]|\Z)'
+
+
+def glob_to_url_regex(host_glob):
+    """Returns a regex that matches URLs with hosts matching `host_glob`."""
+    host_re = ''.join(
+        '[^/?#:@]*' if char == '*'
+        else '[^/?#:@]' if char == '?'
+        else re.escape(char)
+        for char in host_glob
+    )
+    return _URL_PREFIX_RE + host_re + _HOST_END_RE
+
+
+class _TrieNode:  # pylint: disable=too-few-public-methods
+    __slots__ = ('children', 'exact', 'subdomains')
+
+    def __init__(self):
+        self.children = {}
+        self.exact = None
+        self.subdomains = None
+
+
+class HostTrie:
+    """Maps host names and ``*.domain`` globs to route indexes."""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def add(self, host, index):
+        """Adds `host`, optionally starting with ``*.``, for route `index`.
+
+        Only the first index added for a host is kept.
+        """
+        subdomains = host.startswith('*.')
+        if subdomains:
+            host = host[2:]
+        node = self.root
+        for label in reversed(host.lower().strip('.').split('.')):
+            node = node.children.setdefault(label, _TrieNode())
+        if subdomains:
+            if node.subdomains is None:
+                node.subdomains = index
+        elif node.exact is None:
+            node.exact = index
+
+    def lookup(self, host):
+        """Returns the indexes of all entries matching `host`."""
+        matches = []
+        labels = host.lower().strip('.').split('.')
+        node = self.root
+        for depth, label in enumerate(reversed(labels), 1):
+            node = node.children.get(label)
+            if node is None:
+                break
+            if node.subdomains is not None and depth < len(labels):
+                matches.append(node.subdomains)
+        else:
+            if node.exact is not None:
+                matches.append(node.exact)
+        return matches
+
+
+def _is_trie_glob(host_glob):
+    if host_glob.startswith('*.'):
+        host_glob = host_glob[2:]
+    return not any(char in host_glob for char in '*?[')
+
+
+class Router:  # pylint: disable=too-few-public-methods
+    """Matches URLs against `routes`, a sequence of :class:`Route`."""
+
+    def __init__(self, routes):
+        self.routes = list(routes)
+        self.host_trie = HostTrie()
+        self.schemes = {}
+        url_regexes = []
+
+        for index, route in enumerate(self.routes):
+            for host in route.hosts:
+                if _is_trie_glob(host):
+                    self.host_trie.add(host, index)
+                else:
+                    url_regexes.append((index, glob_to_url_regex(host)))
+            for scheme in route.schemes:
+                self.schemes.setdefault(scheme.lower(), index)
+            url_regexes.extend((index, regex) for regex in route.regexes)
+
+        self.url_regex, self.separate_regexes = self._combine(url_regexes)
+
+    @staticmethod
+    def _combine(url_regexes):
+        # Returns the combined regex, or `None`, and a list of
+        # ``(index, regex)`` pairs of regexes that must be matched
+        # separately.
+        combinable = []
+        separate = []
+        for index, regex in url_regexes:
+            try:
+                compiled = re.compile(regex, re.IGNORECASE)
+            except re.error as exc:
+                log.warning('Ignoring invalid route regex %r: %s', regex, exc)
+                continue
+            if has_backreference(regex):
+                # Combining would renumber the groups referred to
+                separate.append((index, compiled))
+            else:
+                combinable.append((index, regex, compiled))
+        if not combinable:
+            return None, separate
+
+        # Alternatives are tried in order, so the first matching
+        # alternative belongs to the first matching route.
+        try:
+            return re.compile('|'.join(
+                f'(?P<route{index}_{num}>{regex})'
+                for num, (index, regex, _compiled) in enumerate(combinable)
+            ), re.IGNORECASE), separate
+        except re.error as exc:
+            log.warning('Unable to combine route regexes: %s', exc)
+            return None, sorted(
+                separate + [
+                    (index, compiled)
+                    for index, _regex, compiled in combinable
+                ],
+                key=lambda pair: pair[0],
+            )
+
+    def _match_regex(self, url):
+        matches = []
+        if self.url_regex is not None:
+            match = self.url_regex.match(url)
+            if match is not None:
+                # The outer, route group is the last to close
+                matches.append(
+                    int(match.lastgroup[len('route'):].split('_')[0]),
+                )
+        for index, regex in self.separate_regexes:
+            if matches and index >= matches[0]:
+                break
+            if regex.match(url):
+                matches.append(index)
+                break
+        return min(matches, default=None)
+
+    def route(self, url):
+        """Returns the first :class:`Route` matching `url`, or `None`."""
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return None
+
+        matches = []
+        if parts.hostname:
+            matches.extend(self.host_trie.lookup(parts.hostname))
+        if parts.scheme.lower() in self.schemes:
+            matches.append(self.schemes[parts.scheme.lower()])
+        regex_match = self._match_regex(url)
+        if regex_match is not None:
+            matches.append(regex_match)
+
+        if not matches:
+            return None
+        route = self.routes[min(matches)]
+        log.debug('URL %s matches route %s', url, route.name)
+        return route
@@ -0,0 +1,55 @@
+"""Incremental search of configured programs."""
+
+
+def fuzzy_match(word, text):
+    """Returns whether the characters of `word` occur in `text` in the
+    same order, though not necessarily next to each other.
+    """
+    if word in text:
+        return True
+    chars = iter(text)
+    # `in` advances the iterator past each found character
+    return all(char in chars for char in word)
+
+
+class ProgramIndex:
+    """Finds programs by their ID and name, as a search query is typed.
+
+    The searchable text of each program is lowercased once, up front.
+    When a query extends the previous one, only the previous matches are
+    searched again, so each keystroke gets cheaper as the query grows.
+    """
+
+    def __init__(self, programs):
+        """`programs` maps program IDs to :class:`uroute.core.Program`s."""
+        self._texts = {
+            prog_id: f'{prog_id}\n{program.name}'.lower()
+            for prog_id, program in programs.items()
+        }
+        self._query = ''
+        self._matches = frozenset(self._texts)
+
+    @property
+    def matches(self):
+        """The IDs of the programs matching the latest query."""
+        return self._matches
+
+    def search(self, query):
+        """Returns the IDs of the programs that match every white space
+        separated word in `query`, ignoring case.
+        """
+        query = ' '.join(query.lower().split())
+        if query == self._query:
+            return self._matches
+
+        if query.startswith(self._query):
+            candidates = self._matches
+        else:
+            candidates = self._texts
+        words = query.split()
+        self._matches = frozenset(
+            prog_id for prog_id in candidates
+            if all(fuzzy_match(word, self._texts[prog_id]) for word in words)
+        )
+        self._query = query
+        return self._matches
@@ -0,0 +1,182 @@
+"""Opt-in timing of Uroute's startup and hot paths.
+
+Tracing is enabled with the ``--trace FILE`` option, or the
+``UROUTE_TRACE`` environment variable. Timed spans are then written to
+``FILE`` on exit, in the Chrome trace event format. Open it in
+``chrome://tracing`` or https://ui.perfetto.dev.
+
+Similarly, ``--profile FILE`` or ``UROUTE_PROFILE`` profile startup with
+:mod:`cProfile`, until the window is first shown, and dump the stats to
+``FILE``. Inspect it with :mod:`pstats` or a viewer like SnakeViz.
+
+When disabled, :func:`span` and :func:`traced` cost little more than a
+function call.
+"""
+
+import atexit
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+ENV_TRACE = 'UROUTE_TRACE'
+ENV_PROFILE = 'UROUTE_PROFILE'
+
+# pylint: disable=invalid-name
+_tracer = None
+_profiler = None
+_profile_path = None
+# pylint: enable=invalid-name
+
+
+def _thread_id():
+    get_id = getattr(threading, 'get_native_id', threading.get_ident)
+    return get_id()
+
+
+def _process_start_time():
+    # Returns the wall clock time at which this process was started, or
+    # `None` where /proc isn't available.
+    try:
+        with open('/proc/self/stat', encoding='UTF-8') as stat_file:
+            # Fields after the command name, which may contain spaces
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        # The start time is in clock ticks since boot
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        since_boot = time.clock_gettime(time.CLOCK_BOOTTIME)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+    return time.time() - (since_boot - started)
+
+
+class Tracer:
+    """Collects timed events, and writes them as a Chrome trace."""
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, end=None, **args):
+        """Records an event called `name` that ran from `start` to `end`,
+        in seconds since the epoch. Without `end`, an instant event is
+        recorded.
+        """
+        event = {
+            'name': name,
+            'cat': 'uroute',
+            'ph': 'i' if end is None else 'X',
+            'ts': start * 1e6,
+            'pid': os.getpid(),
+            'tid': _thread_id(),
+        }
+        if end is None:
+            event['s'] = 'p'  # Show instant events across the process
+        else:
+            event['dur'] = (end - start) * 1e6
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    def save(self):
+        with self._lock:
+            events = list(self.events)
+        try:
+            with open(self.path, 'w', encoding='UTF-8') as trace_file:
+                json.dump(
+                    {'traceEvents': events, 'displayTimeUnit': 'ms'},
+                    trace_file,
+                )
+        except OSError as exc:
+            log.warning('Unable to save trace to %r: %s', self.path, exc)
+            return
+        log.info('Saved %d trace events to %s', len(events), self.path)
+
+
+def enable(trace_path=None, profile_path=None):
+    """Enables tracing to `trace_path` and/or profiling to `profile_path`.
+
+    Both default to the paths in the environment variables.
+    """
+    # pylint: disable=global-statement
+    global _tracer, _profiler, _profile_path
+    trace_path = trace_path or os.environ.get(ENV_TRACE)
+    profile_path = profile_path or os.environ.get(ENV_PROFILE)
+
+    if trace_path and _tracer is None:
+        _tracer = Tracer(trace_path)
+        process_start = _process_start_time()
+        if process_start is not None:
+            _tracer.add('process start to tracing', process_start, time.time())
+        atexit.register(_tracer.save)
+
+    if profile_path and _profiler is None:
+        import cProfile  # pylint: disable=import-outside-toplevel
+        _profile_path = profile_path
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+        atexit.register(stop_profile)
+
+
+def enabled():
+    return _tracer is not None
+
+
+def stop_profile():
+    """Stops profiling, if enabled, and dumps the stats."""
+    global _profiler  # pylint: disable=global-statement
+    if _profiler is None:
+        return
+    profiler, _profiler = _profiler, None
+    profiler.disable()
+    try:
+        profiler.dump_stats(_profile_path)
+    except OSError as exc:
+        log.warning('Unable to save profile to %r: %s', _profile_path, exc)
+        return
+    log.info('Saved profile to %s', _profile_path)
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    """Records the time spent in the ``with`` block as `name`."""
+    if _tracer is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        _tracer.add(name, start, time.time(), **args)
+
+
+def mark(name, **args):
+    """Records an instant event called `name`."""
+    if _tracer is not None:
+        _tracer.add(name, time.time(), **args)
+
+
+def traced(name=None):
+    """Decorates a function to record each call as a span called `name`,
+    which defaults to the function's qualified name.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _tracer.add(span_name, start, time.time())
+        return wrapper
+    return decorator
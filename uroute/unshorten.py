@@ -0,0 +1,263 @@
+"""Resolving short URLs to their targets.
+
+Short URLs of known URL shortener hosts are resolved by following their
+HTTP redirects with ``HEAD`` requests. Requests are made with
+:mod:`asyncio`, over keep-alive connections that are reused for later
+requests to the same host, so that many URLs can be resolved
+concurrently.
+
+Each redirect target is cleaned before it is followed further, and every
+resolution is limited to a strict time budget, after which the URL
+resolved so far is used.
+"""
+
+import asyncio
+import logging
+import ssl
+import threading
+import time
+from urllib.parse import quote, urljoin, urlsplit
+
+from uroute.cache import LruCache
+from uroute.url import USER_AGENT
+
+log = logging.getLogger(__name__)
+
+SHORTENER_HOSTS = frozenset((
+    'amzn.to', 'bit.ly', 'buff.ly', 'cutt.ly', 'dlvr.it', 'fb.me', 'goo.gl',
+    'is.gd', 'lnkd.in', 'ow.ly', 'rb.gy', 'rebrand.ly', 'shorturl.at', 's.id',
+    't.co', 't.ly', 'tiny.cc', 'tinyurl.com', 'trib.al', 'v.gd',
+))
+DEFAULT_TIMEOUT = 2.0  # seconds per URL
+DEFAULT_TTL = 30 * 24 * 60 * 60  # seconds
+MAX_REDIRECTS = 10
+MAX_IDLE_PER_HOST = 4
+REDIRECT_STATUSES = frozenset((301, 302, 303, 307, 308))
+# Responses other than redirects that show a URL is not a short URL
+NOT_FOUND_STATUSES = frozenset((404, 410))
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# Characters that don't need to be quoted in a request target
+_SAFE_TARGET_CHARS = "!#$%&'()*+,/:;=?@[]~"
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, reused per scheme, host and port.
+
+    Connections belong to the event loop they were opened in.
+    """
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+        self.connections_opened = 0
+        self._idle = {}
+        self._ssl_context = None
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        self.connections_opened += 1
+        return await asyncio.open_connection(host, port, ssl=ssl_context)
+
+    async def head(self, url):
+        """Sends a ``HEAD`` request for `url`.
+
+        Returns the response's status code and a `dict` of its headers,
+        with lowercase names.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in DEFAULT_PORTS or not parts.hostname:
+            raise ValueError(f'Unsupported URL: {url}')
+        key = (
+            parts.scheme, parts.hostname,
+            parts.port or DEFAULT_PORTS[parts.scheme],
+        )
+        target = quote(
+            parts.path or '/', safe=_SAFE_TARGET_CHARS,
+        ) + (f'?{quote(parts.query, safe=_SAFE_TARGET_CHARS)}'
+             if parts.query else '')
+        request = (
+            f'HEAD {target} HTTP/1.1\r\n'
+            f'Host: {parts.netloc.rpartition("@")[2]}\r\n'
+            f'User-Agent: {USER_AGENT}\r\n'
+            'Accept: */*\r\n'
+            'Connection: keep-alive\r\n\r\n'
+        ).encode('ascii', 'replace')
+
+        idle = self._idle.get(key)
+        if idle:
+            try:
+                return await self._request(key, idle.pop(), request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server closed the idle connection; try a new one
+                log.debug('Stale connection to %s', key[1])
+        return await self._request(key, await self._connect(key), request)
+
+    @staticmethod
+    async def _read_response(reader):
+        # Returns the HTTP version, status and headers of a response
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed')
+        version, status, _reason = (
+            status_line.decode('latin-1').split(' ', 2) + ['']
+        )[:3]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionResetError('Connection closed')
+            if line in (b'\r\n', b'\n'):
+                break
+            name, _sep, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return version, int(status), headers
+
+    async def _request(self, key, connection, request):
+        reader, writer = connection
+        reusable = False
+        try:
+            writer.write(request)
+            await writer.drain()
+            version, status, headers = await self._read_response(reader)
+            # Responses to HEAD requests have no body
+            reusable = (
+                version == 'HTTP/1.1'
+                and headers.get('connection', '').lower() != 'close'
+            )
+            return status, headers
+        finally:
+            idle = self._idle.setdefault(key, [])
+            if reusable and len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+            else:
+                writer.close()
+
+    def close(self):
+        for idle in self._idle.values():
+            for _reader, writer in idle:
+                writer.close()
+        self._idle.clear()
+
+
+def _identity(url):
+    return url
+
+
+class Unshortener:  # pylint: disable=too-many-instance-attributes
+    """Resolves short URLs of `hosts` by following their redirects.
+
+    Resolved redirects are kept in `cache` (a
+    :class:`uroute.cache.LruCache`) for `ttl` seconds.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self, hosts=SHORTENER_HOSTS, timeout=DEFAULT_TIMEOUT, *,
+        max_redirects=MAX_REDIRECTS, cache=None, ttl=DEFAULT_TTL,
+        concurrency=20,
+    ):
+        self.hosts = frozenset(host.lower() for host in hosts)
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.cache = LruCache(10000) if cache is None else cache
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.pool = ConnectionPool()
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def is_short_url(self, url):
+        try:
+            host = urlsplit(url).hostname
+        except ValueError:
+            return False
+        return host is not None and host.lower() in self.hosts
+
+    async def _redirect_target(self, url):
+        cached = self.cache.get(url)
+        if cached is not None:
+            target, resolved_at = cached
+            if time.time() - resolved_at < self.ttl:
+                return target
+
+        status, headers = await self.pool.head(url)
+        target = None
+        if status in REDIRECT_STATUSES and headers.get('location'):
+            target = urljoin(url, headers['location'])
+        log.debug('Short URL %s: %d %s', url, status, target)
+        if target or 200 <= status < 300 or status in NOT_FOUND_STATUSES:
+            # Don't remember rate limiting, server errors or refused HEAD
+            # requests, which may well succeed next time.
+            self.cache.put(url, (target, time.time()))
+        return target
+
+    async def _follow(self, url, clean, progress):
+        for _ in range(self.max_redirects):
+            if not self.is_short_url(url):
+                break
+            target = await self._redirect_target(url)
+            if target is None:
+                break
+            url = progress[0] = clean(target)
+        return url
+
+    async def resolve(self, url, clean=None):
+        """Resolves `url`, cleaning each redirect target with `clean`.
+
+        Gives up after ``self.timeout`` seconds, or on any network error,
+        and returns the URL resolved that far.
+        """
+        if clean is None:
+            clean = _identity
+        progress = [clean(url)]
+        try:
+            return await asyncio.wait_for(
+                self._follow(progress[0], clean, progress), self.timeout,
+            )
+        except asyncio.TimeoutError:
+            log.warning('Timed out resolving %s', url)
+        except (OSError, ValueError) as exc:
+            log.warning('Unable to resolve %s: %s', url, exc)
+        return progress[0]
+
+    async def resolve_many(self, urls, clean=None):
+        """Resolves all short URLs in `urls` concurrently.
+
+        Returns a list with every URL in `urls`, resolved where possible.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def resolve(url):
+            if not self.is_short_url(url):
+                return url
+            async with semaphore:
+                return await self.resolve(url, clean)
+
+        return list(await asyncio.gather(*(resolve(url) for url in urls)))
+
+    def run(self, coroutine):
+        """Runs `coroutine` in this instance's own event loop.
+
+        Reusing the loop keeps pooled connections usable across calls.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            return self._loop.run_until_complete(coroutine)
+
+    def resolve_sync(self, url, clean=None):
+        """Blocking version of :meth:`resolve`."""
+        return self.run(self.resolve(url, clean))
+
+    def close(self):
+        # Wait for any resolution running in another thread
+        with self._lock:
+            self.pool.close()
+            if self._loop is not None:
+                # Let closed connections clean up
+                self._loop.run_until_complete(asyncio.sleep(0))
+                self._loop.close()
+                self._loop = None
@@ -1,127 +1,793 @@
 """URL parsing and processing functions."""
 
+import bisect
+import contextlib
+import hashlib
 import json
 import logging
+import os
 import re
+import shutil
+import threading
+import time
+from collections import namedtuple
 from urllib.parse import parse_qsl, unquote, urlencode, urlparse, urlunparse
-from urllib.request import Request, urlopen
+
+from uroute.util import (
+    create_temp_file, has_backreference, load_pickle, save_pickle_atomic,
+)
 
 log = logging.getLogger(__name__)
 
 
+# URLs end at white space, angle brackets, quotes or backticks. Trailing
+# punctuation and unbalanced closing brackets are trimmed off matches.
+# Word boundaries are checked outside of the pattern: a leading ``\b`` or
+# re.IGNORECASE keep the regex engine from scanning for the literal
+# ``http`` prefix, which makes searching large texts many times slower.
+_URL_RE = re.compile(r'''https?://[^\s<>"'`]+''')
+_URL_TRAILING_PUNCTUATION = '.,:;!?*'
+_URL_CLOSING_BRACKETS = {')': '(', ']': '[', '}': '{'}
+
+
+def _url_end(text, start, end):
+    # Returns the end of the URL in text[start:end], without trailing
+    # punctuation or closing brackets that belong to the surrounding text.
+    while end > start:
+        char = text[end - 1]
+        if char in _URL_TRAILING_PUNCTUATION:
+            end -= 1
+        elif char in _URL_CLOSING_BRACKETS and text.count(
+                char, start, end) > text.count(
+                    _URL_CLOSING_BRACKETS[char], start, end):
+            end -= 1
+        else:
+            break
+    return end
+
+
+def extract_urls(contents):
+    """Yields every HTTP(S) URL found in `contents`, in order.
+
+    URLs are found lazily, so that large contents are not scanned further
+    than needed. Punctuation following a URL, like a sentence's period or
+    the closing bracket of a parenthesized URL, is not included. Brackets
+    that are balanced within the URL are kept, as in
+    ``https://en.wikipedia.org/wiki/Python_(programming_language)``.
+    """
+    for match in _URL_RE.finditer(contents):
+        start = match.start()
+        if start and contents[start - 1].isalnum():
+            continue  # Not at a word boundary
+        end = _url_end(contents, start, match.end())
+        # Skip URLs without anything after the scheme
+        if end > contents.index('://', start) + 3:
+            yield contents[start:end]
+
+
 def extract_url(contents):
     """Attempts to find and extract a URL from the given content."""
-    # Based on https://stackoverflow.com/a/840110
-    match = re.search(r'(?P<url>https?://[^\s]+)', contents)
-    if match and match.group('url'):
-        return match.group('url')
-    return None
+    return next(extract_urls(contents), None)
 
 
 URL_CLEARURLS_DATA = 'https://rules2.clearurls.xyz/data.minify.json'
 USER_AGENT = 'uroute URLCleaner (python urllib)'
 
 
-def download_rules_data(save_path=None):
-    """Download URL cleaning rules to `save_path`."""
-    log.debug('Downloading rules data to %r', save_path)
-    with open(save_path, 'w', encoding='UTF-8') as rules_file:
-        request = Request(URL_CLEARURLS_DATA,
-                          headers={'User-Agent': USER_AGENT})
-        with urlopen(request) as resp:
-            rules_file.write(resp.read().decode())
+DOWNLOAD_TIMEOUT = 30  # seconds
+
+
+def _read_validators(save_path):
+    try:
+        with open(f'{save_path}.validators', encoding='UTF-8') as val_file:
+            return json.load(val_file)
+    except Exception:  # pylint: disable=broad-except
+        return {}
+
+
+def _write_validators(save_path, headers):
+    validators = {
+        name: headers[name] for name in ('ETag', 'Last-Modified')
+        if headers.get(name)
+    }
+    try:
+        with open(
+            f'{save_path}.validators', 'w', encoding='UTF-8',
+        ) as val_file:
+            json.dump(validators, val_file)
+    except OSError as exc:
+        log.warning('Unable to save rules validators: %s', exc)
+
+
+def download_rules_data(
+    save_path, url=URL_CLEARURLS_DATA, conditional=False,
+    timeout=DOWNLOAD_TIMEOUT,
+):
+    """Download URL cleaning rules to `save_path`.
+
+    The rules are streamed into a temporary file, which only replaces
+    `save_path` once it was completely downloaded and found to contain
+    valid JSON. A failed download leaves `save_path` untouched.
+
+    The response's ``ETag`` and ``Last-Modified`` headers are stored
+    next to `save_path`. With `conditional=True`, they are sent back to
+    the server, which can then respond that the rules are unchanged.
+
+    Returns `True` if new rules were saved, or `False` if the rules were
+    not modified.
+    """
+    # urllib.request is slow to import, and rarely needed
+    # pylint: disable=import-outside-toplevel
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+
+    log.debug('Downloading rules data from %r to %r', url, save_path)
+    headers = {'User-Agent': USER_AGENT}
+    if conditional and os.path.isfile(save_path):
+        validators = _read_validators(save_path)
+        if validators.get('ETag'):
+            headers['If-None-Match'] = validators['ETag']
+        if validators.get('Last-Modified'):
+            headers['If-Modified-Since'] = validators['Last-Modified']
+
+    tmp_path = create_temp_file(save_path)
+    try:
+        with urlopen(Request(url, headers=headers), timeout=timeout) as resp:
+            with open(tmp_path, 'wb') as tmp_file:
+                shutil.copyfileobj(resp, tmp_file)
+            response_headers = resp.headers
+
+        # Make sure that we don't replace valid rules with garbage
+        _read_rules_data(tmp_path)
+        os.replace(tmp_path, save_path)
+    except HTTPError as exc:
+        if exc.code == 304:
+            log.debug('Rules data not modified')
+            # Record the check, without touching the rules file itself
+            with contextlib.suppress(OSError):
+                os.utime(f'{save_path}.validators')
+            return False
+        raise
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+
+    _write_validators(save_path, response_headers)
+    log.debug('Rules data saved to %r', save_path)
+    return True
+
+
+def rules_data_age(save_path):
+    """Returns the seconds since `save_path` was last downloaded or found
+    to be up to date, or `None` if it was never downloaded.
+    """
+    for path in (f'{save_path}.validators', save_path):
+        try:
+            return time.time() - os.path.getmtime(path)
+        except OSError:
+            pass
+    return None
+
+
+def refresh_rules_in_background(rules_path, on_update, **kwargs):
+    """Conditionally re-downloads `rules_path` in a background thread.
+
+    `on_update` is called, from the background thread, if new rules were
+    saved. Any rules already loaded from `rules_path` can keep being used
+    in the meantime. Extra keyword arguments are passed to
+    :func:`download_rules_data`.
+
+    Returns the started :class:`threading.Thread`.
+    """
+    def refresh():
+        try:
+            if download_rules_data(rules_path, conditional=True, **kwargs):
+                on_update()
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Unable to refresh rules data:')
+
+    thread = threading.Thread(
+        target=refresh, name='uroute-rules-refresh', daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def _read_rules_data(rules_path):
+    with open(rules_path, encoding='UTF-8') as rules_file:
+        rules = json.load(rules_file)
+    log.debug('URL cleaning rules loaded from %r', rules_path)
+    return rules
+
+
+# Bump when the pickled structure of `CompiledRules` changes
+RULES_CACHE_FORMAT = 3
 
 
-def load_cleaning_rules(rules_path):
+def _rules_cache_key(rules_path):
+    stat = os.stat(rules_path)
+    return (
+        RULES_CACHE_FORMAT, os.path.abspath(rules_path),
+        stat.st_mtime_ns, stat.st_size,
+    )
+
+
+def load_rules_cache(cache_path, rules_path):
+    """Loads compiled rules for `rules_path` from `cache_path`.
+
+    Returns `None` if the cache is missing, unreadable or was written for
+    a different version of the rules file, as determined by its path,
+    modification time and size.
+    """
+    try:
+        key = _rules_cache_key(rules_path)
+    except OSError:
+        return None
+    rules = load_pickle(cache_path, key)
+    if rules is not None:
+        log.debug('URL cleaning rules loaded from cache %r', cache_path)
+    return rules
+
+
+def save_rules_cache(cache_path, rules_path, rules):
+    """Saves compiled `rules`, read from `rules_path`, to `cache_path`."""
+    try:
+        key = _rules_cache_key(rules_path)
+    except OSError as exc:
+        log.warning('Unable to save rules cache: %s', exc)
+        return
+    save_pickle_atomic(cache_path, key, rules)
+
+
+def load_cleaning_rules(rules_path, cache_path=None):
     """Loads URL cleaning data from `rules_path`.
 
     If the specified rules file path does not point to a valid JSON
     file, ClearURLs's `data.min.json
     <https://gitlab.com/ClearURLs/rules/-/blob/master/data.min.json>`_
     is automatically downloaded and loaded.
+
+    If `cache_path` is given, the compiled rules are cached there and
+    reused for as long as the rules file does not change.
+
+    Returns a :class:`CompiledRules` instance, ready to clean URLs.
     """
+    if cache_path:
+        rules = load_rules_cache(cache_path, rules_path)
+        if rules is not None:
+            return rules
+
     try:
-        with open(rules_path, encoding='UTF-8') as rules_file:
-            rules = json.load(rules_file)
-            log.debug('URL cleaning rules loaded from %r', rules_path)
-        return rules
+        rules_data = _read_rules_data(rules_path)
     except Exception:  # pylint: disable=broad-except
         # If anything went wrong reading the rules file, redownload
         # it.
         download_rules_data(rules_path)
-        with open(rules_path, encoding='UTF-8') as rules_file:
-            rules = json.load(rules_file)
-            log.debug('URL cleaning rules loaded from %r', rules_path)
-        return rules
+        rules_data = _read_rules_data(rules_path)
+    rules = CompiledRules(rules_data)
 
+    if cache_path:
+        save_rules_cache(cache_path, rules_path, rules)
+    return rules
 
-def clean_url(rules, url, recurse_redir=True):
-    """Clean the given URL with the loaded rules data.
 
-    The format of `rules_data` is the parsed JSON found in ClearURLs's
-    [`data.min.json`](https://gitlab.com/ClearURLs/rules/-/blob/master/data.min.json)
-    file.
+def update_cleaning_rules(rules, rules_path, cache_path=None):
+    """Updates loaded `rules` to the current contents of `rules_path`,
+    e.g. after the rules were refreshed.
 
-    URLs matching a provider's `urlPattern` and one of that provider's
-    redirection patterns, will cause the URL to be replaced with the
-    match's first matched group.
+    Only providers that were added or changed are compiled; see
+    :meth:`CompiledRules.updated`. If `cache_path` is given, the updated
+    rules are cached there.
 
-    Another Python implementation to download and apply the rules to a
-    URL, written by the ClearURLs author, can be found
-    [here](https://gitlab.com/KevinRoebert/ClearUrls/snippets/1834899).
+    Returns the updated :class:`CompiledRules` and a :class:`RulesDiff`.
+    """
+    new_rules, diff = rules.updated(_read_rules_data(rules_path))
+    log.debug('URL cleaning rules updated: %s', diff)
+    if cache_path:
+        save_rules_cache(cache_path, rules_path, new_rules)
+    return new_rules, diff
 
-    Set `recurse_redir=False` to prevent cleaning redirect targets
-    recursively.
+
+# Matches the start of ClearURLs URL patterns that are anchored to a
+# literal host label, optionally preceded by any number of subdomains,
+# e.g. ``^https?:\/\/(?:[a-z0-9-]+\.)*?amazon(?:\.[a-z]{2,}){1,}``.
+# The label must be followed by an escaped dot or ClearURLs's TLD group,
+# so that it is known to be a complete label of the matched URL's host.
+_HOST_ANCHORED_PATTERN_RE = re.compile(
+    r'\^?https\?:\\/\\/'
+    r'(?:\(\?:\[a-z0-9-\]\+\\\.\)\*\?)?'
+    r'(?P<label>(?:[a-z0-9-]|\\-)+)'
+    r'(?:\\\.|\(\?:\\\.\[a-z\]\{2,\}\)\{1,\})'
+    r'(?![?*+{])',
+    re.IGNORECASE,
+)
+# The part of a URL that host-anchored patterns are matched against
+_URL_HOST_RE = re.compile(r'[a-z0-9.-]*', re.IGNORECASE)
+
+
+def _has_toplevel_alternation(pattern):
+    depth = 0
+    in_class = False
+    chars = iter(pattern)
+    for char in chars:
+        if char == '\\':
+            next(chars, None)
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+    return False
+
+
+def pattern_host_key(url_pattern):
+    """Returns the host label that `url_pattern` is anchored to.
+
+    Any URL matched by `url_pattern` is guaranteed to contain the
+    returned label as one of the dot-separated labels of its host.
+    Returns `None` for patterns that can't be proven to be anchored to a
+    host label, like ClearURLs's catch-all ``globalRules`` provider.
+
+    For the pattern of ClearURLs's ``amazon`` provider, ``'amazon'`` is
+    returned.
+    """
+    match = _HOST_ANCHORED_PATTERN_RE.match(url_pattern)
+    if match is None or _has_toplevel_alternation(url_pattern):
+        return None
+    return match.group('label').replace('\\-', '-').lower()
+
+
+def url_host_labels(url):
+    """Returns the lowercase, dot-separated labels of `url`'s host."""
+    start = url.find('://')
+    if start < 0:
+        return ()
+    return _URL_HOST_RE.match(url, start + 3).group().lower().split('.')
+
+
+def _compile_patterns(patterns, flags=0):
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append(re.compile(pattern, flags))
+        except re.error as exc:
+            log.warning('Ignoring invalid pattern %r: %s', pattern, exc)
+    return tuple(compiled)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('UTF-8')).hexdigest()
+
+
+def _provider_digest(provider):
+    return _digest(json.dumps(provider, sort_keys=True))
+
+
+class _PatternSet:  # pylint: disable=too-few-public-methods
+    """Patterns that could not be combined into a single regex."""
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+
+    def match(self, string):
+        for pattern in self.patterns:
+            match = pattern.match(string)
+            if match:
+                return match
+        return None
+
+
+def _combine_patterns(patterns, flags=0):
+    """Combines `patterns` into a single alternation regex.
+
+    The result's ``match`` matches where any of the patterns match.
+    Returns `None` if there are no valid patterns.
     """
-    for provider in rules.get('providers', {}).values():
-        if not re.match(provider['urlPattern'], url, re.IGNORECASE):
-            continue
+    compiled = _compile_patterns(patterns, flags)
+    if not compiled:
+        return None
+    if len(compiled) == 1:
+        return compiled[0]
+    if any(has_backreference(pattern.pattern) for pattern in compiled):
+        # Combining would renumber the groups referred to
+        return _PatternSet(compiled)
+    try:
+        return re.compile(
+            '|'.join(f'(?:{pattern.pattern})' for pattern in compiled),
+            flags,
+        )
+    except re.error:
+        # Patterns with clashing group names can't be combined
+        return _PatternSet(compiled)
+
 
+class CompiledProvider:
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """A single ClearURLs provider, with all of its patterns compiled.
+
+    When unpickled, e.g. from the rules cache, the patterns are only
+    compiled again when the provider is first used.
+    """
+
+    _COMPILED_ATTRS = frozenset((
+        'url_pattern', 'exceptions', 'redirections', 'param_rule',
+        'raw_rules',
+    ))
+
+    def __init__(self, name, provider, digest=None):
+        self.name = name
+        self.source = provider
+        self.digest = digest or _provider_digest(provider)
+        self.host_key = pattern_host_key(provider['urlPattern'])
+        self._compile()
+
+    def _compile(self):
+        provider = self.source
+        url_pattern = _compile_patterns(
+            [provider['urlPattern']], re.IGNORECASE,
+        )
+        # A provider with an invalid URL pattern never matches
+        self.url_pattern = url_pattern[0] if url_pattern else None
+        self.exceptions = _compile_patterns(
+            provider.get('exceptions', []), re.IGNORECASE,
+        )
+        self.redirections = _compile_patterns(
+            provider.get('redirections', []), re.IGNORECASE,
+        )
+        self.param_rule = _combine_patterns((
+            *provider.get('rules', []),
+            *provider.get('referralMarketing', []),
+        ), re.IGNORECASE)
+        self.raw_rules = _compile_patterns(provider.get('rawRules', []))
+
+    def __getstate__(self):
+        return {
+            'name': self.name,
+            'source': self.source,
+            'digest': self.digest,
+            'host_key': self.host_key,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, which are the compiled
+        # patterns of an unpickled provider.
+        if name not in self._COMPILED_ATTRS:
+            raise AttributeError(name)
+        self._compile()
+        return getattr(self, name)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.name!r}>'
+
+    def matches(self, url):
+        """Returns whether this provider applies to `url`."""
+        if self.url_pattern is None or not self.url_pattern.match(url):
+            return False
         # If any exceptions are matched, this provider is skipped
-        if any(
-            re.match(exc, url, re.IGNORECASE)
-            for exc in provider.get('exceptions', [])
-        ):
-            continue
-
-        for redir in provider.get('redirections', []):
-            match = re.match(redir, url, re.IGNORECASE)
+        return not any(exc.match(url) for exc in self.exceptions)
+
+    def redirect_target(self, url):
+        """Returns the redirection target embedded in `url`, or `None`."""
+        for redir in self.redirections:
+            match = redir.match(url)
             try:
                 if match and match.group(1) and match.group(1) != url:
-                    url = unquote(match.group(1))
-                    # If redirect found, recurse on target
-                    if recurse_redir:
-                        url = clean_url(rules, url, recurse_redir=True)
-                    return url
+                    return unquote(match.group(1))
             except IndexError:
                 # If we get here, we got a redirection match, but no
                 # matched grouped. The redirection rule is probably
                 # faulty.
                 pass
+        return None
+
+    def strip_params(self, url):
+        """Removes query parameters matching this provider's rules.
+
+        `url` is returned unchanged if no parameters were removed.
+        """
+        if self.param_rule is None:
+            return url
 
         # Explode query parameters to be checked against rules
         parsed_url = urlparse(url)
+        if not parsed_url.query:
+            return url
         query_params = parse_qsl(parsed_url.query)
+        kept_params = [
+            param for param in query_params
+            if not self.param_rule.match(param[0])
+        ]
+        if len(kept_params) == len(query_params):
+            return url
 
-        for rule in (
-            *provider.get('rules', []),
-            *provider.get('referralMarketing', [])
-        ):
-            query_params = [
-                param for param in query_params
-                if not re.match(rule, param[0], re.IGNORECASE)
-            ]
-
-        url = urlunparse((
+        return urlunparse((
             parsed_url.scheme,
             parsed_url.netloc,
             parsed_url.path,
             parsed_url.params,
-            urlencode(query_params),
+            urlencode(kept_params),
             parsed_url.fragment,
         ))
 
-        for raw_rule in provider.get('rawRules', []):
-            url = re.sub(raw_rule, '', url)
 
-    return url
+MAX_REDIRECTS = 10
+REDIRECT_MEMO_SIZE = 1024
+
+
+class RulesDiff(namedtuple(
+        'RulesDiff', ('added', 'removed', 'changed', 'unchanged'))):
+    """The names of the providers that differ between two versions of
+    cleaning rules. It is false if no providers were added, removed or
+    changed.
+    """
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self):
+        return (
+            f'{len(self.added)} added, {len(self.removed)} removed, '
+            f'{len(self.changed)} changed, {len(self.unchanged)} unchanged'
+        )
+
+
+class CompiledRules:
+    """ClearURLs rules data, compiled once for repeated URL cleaning.
+
+    The format of `rules_data` is the parsed JSON found in ClearURLs's
+    [`data.min.json`](https://gitlab.com/ClearURLs/rules/-/blob/master/data.min.json)
+    file. Every pattern in it is compiled when the instance is created,
+    so that cleaning a URL only has to run the compiled patterns.
+
+    Providers are indexed by the host label their `urlPattern` is
+    anchored to (see :func:`pattern_host_key`), so that a URL is only
+    checked against the providers for its own host labels, plus the
+    catch-all providers that can't be indexed.
+
+    `fingerprint` identifies the rules' content, and changes whenever
+    any provider changes.
+    """
+
+    def __init__(self, rules_data=None):
+        if rules_data is None:
+            rules_data = {}
+        self.providers = [
+            CompiledProvider(name, provider)
+            for name, provider in rules_data.get('providers', {}).items()
+        ]
+        self.fingerprint = self._fingerprint(self.providers)
+        self._build_index()
+        self.max_redirects = MAX_REDIRECTS
+        # Redirecting URL => the URL that its redirect chain ends at
+        self._redirect_memo = {}
+
+    def __len__(self):
+        return len(self.providers)
+
+    @staticmethod
+    def _fingerprint(providers):
+        return _digest(' '.join(
+            f'{provider.name!r}:{provider.digest}' for provider in providers
+        ))
+
+    def _build_index(self):
+        self.host_index = {}
+        self.unindexed = []
+        for position, provider in enumerate(self.providers):
+            if provider.host_key is None:
+                self.unindexed.append(position)
+            else:
+                self.host_index.setdefault(
+                    provider.host_key, [],
+                ).append(position)
+
+    def _reindex(self, position, old_key, new_key):
+        # Moves the provider at `position` from `old_key` to `new_key`
+        if old_key == new_key:
+            return
+        if old_key is None:
+            self.unindexed.remove(position)
+        else:
+            self.host_index[old_key].remove(position)
+            if not self.host_index[old_key]:
+                del self.host_index[old_key]
+        if new_key is None:
+            bisect.insort(self.unindexed, position)
+        else:
+            bisect.insort(self.host_index.setdefault(new_key, []), position)
+
+    def updated(self, rules_data):
+        """Returns these rules updated to `rules_data`, and a
+        :class:`RulesDiff` of the providers that changed.
+
+        Providers are matched by name, and compared by content digest.
+        Only new and changed providers are compiled; unchanged ones are
+        shared with these rules, which are left as they are. If only
+        providers' content changed, the index is only updated for those
+        providers. Otherwise, the index is rebuilt, which is still cheap
+        compared to compiling.
+
+        If nothing changed, these rules themselves are returned.
+        """
+        providers, diff = self._diff_providers(rules_data)
+        same_order = len(providers) == len(self.providers) and all(
+            new.name == old.name
+            for new, old in zip(providers, self.providers)
+        )
+        if not diff and same_order:
+            return self, diff
+
+        rules = self.__class__.__new__(self.__class__)
+        rules.providers = providers
+        rules.fingerprint = self._fingerprint(providers)
+        rules.max_redirects = self.max_redirects
+        # pylint: disable=protected-access
+        rules._redirect_memo = {}
+        if same_order:
+            rules._update_index(self)
+        else:
+            rules._build_index()
+        return rules, diff
+
+    def _diff_providers(self, rules_data):
+        # Returns the providers for `rules_data`, reusing unchanged ones,
+        # and a `RulesDiff`
+        current = {provider.name: provider for provider in self.providers}
+        providers = []
+        diff = RulesDiff([], [], [], [])
+        for name, source in rules_data.get('providers', {}).items():
+            digest = _provider_digest(source)
+            provider = current.get(name)
+            if provider is not None and provider.digest == digest:
+                diff.unchanged.append(name)
+            else:
+                if provider is None:
+                    diff.added.append(name)
+                else:
+                    diff.changed.append(name)
+                provider = CompiledProvider(name, source, digest=digest)
+            providers.append(provider)
+        new_names = {provider.name for provider in providers}
+        diff.removed.extend(name for name in current if name not in new_names)
+        return providers, diff
+
+    def _update_index(self, previous):
+        # Copies the index of `previous` rules, with the same providers in
+        # the same order, and re-indexes the providers that were replaced
+        self.host_index = {
+            key: list(positions)
+            for key, positions in previous.host_index.items()
+        }
+        self.unindexed = list(previous.unindexed)
+        for position, (provider, old) in enumerate(
+                zip(self.providers, previous.providers)):
+            if provider is not old:
+                self._reindex(position, old.host_key, provider.host_key)
+
+    def candidates(self, url):
+        """Returns the providers that might apply to `url`, in order."""
+        positions = set(self.unindexed)
+        for label in url_host_labels(url):
+            positions.update(self.host_index.get(label, ()))
+        return [self.providers[pos] for pos in sorted(positions)]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_redirect_memo']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._redirect_memo = {}
+
+    def _clean_once(self, url):
+        """Cleans `url` without following redirects.
+
+        Returns a ``(cleaned_url, redirect_target)`` pair, of which the
+        latter is `None` if `url` is not a redirect.
+        """
+        for provider in self.candidates(url):
+            if not provider.matches(url):
+                continue
+
+            target = provider.redirect_target(url)
+            if target is not None:
+                return url, target
+
+            url = provider.strip_params(url)
+
+            for raw_rule in provider.raw_rules:
+                url = raw_rule.sub('', url)
+
+        return url, None
+
+    def clean(self, url, recurse_redir=True, max_redirects=None):
+        """Clean `url` with the compiled rules.
+
+        Redirect targets are cleaned in turn, until no more redirects are
+        found, or `max_redirects` redirects were unwrapped (the
+        ``max_redirects`` attribute by default). Redirect chains that loop
+        back to an earlier URL, or that are too long, end at the last
+        target reached, without cleaning it. The ends of redirect chains,
+        and their lengths, are remembered, so that chains sharing a tail
+        are only followed once, within any limit.
+
+        :seealso: :func:`clean_url`
+        """
+        if max_redirects is None:
+            max_redirects = self.max_redirects
+        memo = self._redirect_memo
+
+        chain = []
+        seen = {url}
+        complete = True
+        tail_length = 0
+        while True:
+            if recurse_redir and url in memo:
+                end, length = memo[url]
+                # The memoized end is only reached within the limit
+                if len(chain) + length <= max_redirects:
+                    url, tail_length = end, length
+                    break
+
+            cleaned, target = self._clean_once(url)
+            if target is None:
+                url = cleaned
+                break
+            if not recurse_redir:
+                return target
+            if len(chain) >= max_redirects:
+                log.debug('Stopped after %d redirects: %s', len(chain), url)
+                complete = False
+                break
+
+            chain.append(url)
+            if target in seen:
+                log.debug('Redirect loop at %s', target)
+                url, complete = target, False
+                break
+            seen.add(target)
+            url = target
+
+        # Truncated chains may end elsewhere when started further down
+        if chain and complete:
+            if len(memo) + len(chain) > REDIRECT_MEMO_SIZE:
+                memo.clear()
+            for position, redirect in enumerate(chain):
+                memo[redirect] = (url, len(chain) - position + tail_length)
+        return url
+
+
+def clean_url(rules, url, recurse_redir=True):
+    """Clean the given URL with the loaded rules data.
+
+    `rules` is either a :class:`CompiledRules` instance, as returned by
+    :func:`load_cleaning_rules`, or the parsed JSON found in ClearURLs's
+    [`data.min.json`](https://gitlab.com/ClearURLs/rules/-/blob/master/data.min.json)
+    file. The latter is compiled on every call, so prefer passing
+    :class:`CompiledRules` when cleaning more than one URL.
+
+    URLs matching a provider's `urlPattern` and one of that provider's
+    redirection patterns, will cause the URL to be replaced with the
+    match's first matched group.
+
+    Another Python implementation to download and apply the rules to a
+    URL, written by the ClearURLs author, can be found
+    [here](https://gitlab.com/KevinRoebert/ClearUrls/snippets/1834899).
+
+    Set `recurse_redir=False` to prevent cleaning redirect targets
+    recursively.
+    """
+    if not isinstance(rules, CompiledRules):
+        rules = CompiledRules(rules)
+    return rules.clean(url, recurse_redir=recurse_redir)
@@ -1,5 +1,19 @@
 """Utility functions."""
 
+import contextlib
+import logging
+import os
+import pickle
+import re
+import subprocess
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+# A numbered or named backreference, not preceded by an escaped backslash
+_BACKREFERENCE_RE = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?P=')
+
 
 def listify(x):
     """Puts ``x`` in a new list if it is not already a list. ``None`` returns
@@ -7,3 +21,125 @@ def listify(x):
     if x is None:
         return []
     return x if isinstance(x, (list, tuple)) else [x]
+
+
+def chunked(iterable, size):
+    """Yields lists of up to ``size`` consecutive items from ``iterable``."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def has_backreference(regex):
+    """Returns whether ``regex`` refers back to one of its groups.
+
+    Such regexes can't be combined with others into a single regex, as
+    that renumbers their groups.
+    """
+    return _BACKREFERENCE_RE.search(regex) is not None
+
+
+def mtime_ns(path):
+    """Returns the modification time of ``path`` in nanoseconds, or ``None``
+        if it can't be determined."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_pickle(path, key):
+    """Returns the object saved to ``path`` by :func:`save_pickle_atomic`
+        with an equal ``key``.
+
+    Returns ``None`` if the file is missing, unreadable or was saved with a
+    different key, e.g. by another version of Uroute.
+    """
+    try:
+        with open(path, 'rb') as pickle_file:
+            saved = pickle.load(pickle_file)
+    except FileNotFoundError:
+        return None
+    except Exception as exc:  # pylint: disable=broad-except
+        log.warning('Ignoring unreadable file %r: %s', path, exc)
+        return None
+
+    if not isinstance(saved, tuple) or len(saved) != 2 or saved[0] != key:
+        log.debug('Ignoring stale file %r', path)
+        return None
+    return saved[1]
+
+
+def create_temp_file(path):
+    """Creates an empty temporary file, to be moved to ``path`` once
+        written, and returns its path.
+
+    The file is created in the same directory as ``path``, with a name that
+    is unique across processes and threads.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f'{os.path.basename(path)}.', suffix='.tmp',
+        dir=os.path.dirname(path) or os.curdir,
+    )
+    os.close(fd)
+    return tmp_path
+
+
+def save_pickle_atomic(path, key, obj):
+    """Pickles ``obj`` to ``path``, with ``key`` for :func:`load_pickle`.
+
+    The file is written under a temporary name and then renamed, so that
+    readers never see a partially written file. Returns whether ``obj`` was
+    saved.
+    """
+    tmp_path = None
+    try:
+        tmp_path = create_temp_file(path)
+        with open(tmp_path, 'wb') as pickle_file:
+            pickle.dump(
+                (key, obj), pickle_file, protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, path)
+    except Exception as exc:  # pylint: disable=broad-except
+        # Unpicklable objects raise various exceptions
+        log.warning('Unable to save %r: %s', path, exc)
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+        return False
+    log.debug('Saved %r', path)
+    return True
+
+
+def spawn_detached(args):
+    """Starts the program in ``args`` fully detached from this process, and
+    returns its PID without waiting for it.
+
+    The program runs in a new session, with its standard input and output
+    connected to ``/dev/null``. ``args[0]`` is looked up in ``$PATH``.
+    """
+    if hasattr(os, 'posix_spawnp'):
+        devnull = os.devnull
+        pid = os.posix_spawnp(
+            args[0], args, os.environ,
+            file_actions=[
+                (os.POSIX_SPAWN_OPEN, 0, devnull, os.O_RDONLY, 0),
+                (os.POSIX_SPAWN_OPEN, 1, devnull, os.O_WRONLY, 0),
+                (os.POSIX_SPAWN_OPEN, 2, devnull, os.O_WRONLY, 0),
+            ],
+            setsid=True,
+        )
+    else:
+        pid = subprocess.Popen(  # pylint: disable=consider-using-with
+            args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, start_new_session=True,
+        ).pid
+
+    # Reap the child when it exits, in case this process outlives it
+    threading.Thread(target=os.waitpid, args=(pid, 0), daemon=True).start()
+    return pid
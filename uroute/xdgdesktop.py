@@ -1,15 +1,36 @@
 """Contains all freedesktop-related functionality."""
 
+import contextlib
+import json
 import logging
 import os
+import shlex
 import shutil
 import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import xdg.BaseDirectory
 from xdg.DesktopEntry import DesktopEntry
 
+from uroute.__version__ import VERSION
+from uroute.util import (
+    create_temp_file, load_pickle, mtime_ns, save_pickle_atomic,
+)
+
 log = logging.getLogger(__name__)
 
+BROWSER_MIME_TYPE = 'x-scheme-handler/http'
+URL_FIELD_CODES = ('%u', '%U', '%f', '%F')
+
+BrowserEntry = namedtuple(
+    'BrowserEntry',
+    ('desktop_id', 'name', 'command', 'icon', 'actions', 'path'),
+)
+DesktopAction = namedtuple(
+    'DesktopAction', ('action_id', 'name', 'command', 'icon'),
+)
+
 
 def get_or_create_desktop_file():
     desktop = lookup_desktop_file('uroute.desktop')
@@ -68,17 +89,84 @@ def install_as_default(desktop):
     return set_default_browser(desktop)
 
 
-def get_default_browser():
+def _mimeapps_list_paths():
+    # The locations of mimeapps.list files, as per the XDG MIME
+    # Applications Associations specification, including the deprecated
+    # ones in data dirs.
+    desktops = [
+        desktop.lower() for desktop in
+        os.environ.get('XDG_CURRENT_DESKTOP', '').split(':') if desktop
+    ]
+    file_names = [f'{desktop}-mimeapps.list' for desktop in desktops]
+    file_names.append('mimeapps.list')
+
+    paths = [
+        os.path.join(dir_name, file_name)
+        for dir_name in xdg.BaseDirectory.xdg_config_dirs
+        for file_name in file_names
+    ]
+    paths.extend(
+        os.path.join(dir_name, 'applications', file_name)
+        for dir_name in xdg.BaseDirectory.xdg_data_dirs
+        for file_name in file_names
+    )
+    return paths
+
+
+def _default_browser_cache_key():
+    return [os.environ.get('XDG_CURRENT_DESKTOP', '')] + [
+        [path, mtime_ns(path)] for path in _mimeapps_list_paths()
+    ]
+
+
+def _default_browser_cache_path():
+    return get_cache_file_path('default-browser.json')
+
+
+def get_default_browser(use_cache=True):
+    """Returns the desktop entry file name of the default web browser, or
+    `None` if it can't be determined.
+
+    The result of ``xdg-settings`` is cached until a ``mimeapps.list``
+    file changes, unless `use_cache` is false.
+    """
+    cache_key = _default_browser_cache_key()
+    cache_path = _default_browser_cache_path()
+    if use_cache:
+        try:
+            with open(cache_path, encoding='UTF-8') as cache_file:
+                cached = json.load(cache_file)
+            if cached['key'] == cache_key:
+                log.debug('Cached default browser: %s', cached['default'])
+                return cached['default']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as exc:
+            log.debug('Ignoring invalid default browser cache: %s', exc)
+
     which('xdg-settings', raise_exception=True)
 
     cmd = 'xdg-settings get default-web-browser'.split()
     try:
         default = subprocess.check_output(cmd).decode().strip()
         log.debug('$ %r => %s', cmd, default)
-        return default
     except Exception:  # pylint: disable=broad-except
         log.exception('Unable to get default browser:')
-    return None
+        return None
+
+    tmp_path = None
+    try:
+        tmp_path = create_temp_file(cache_path)
+        with open(tmp_path, 'w', encoding='UTF-8') as cache_file:
+            json.dump({'key': cache_key, 'default': default}, cache_file)
+        # Other Uroute processes may be reading the cache
+        os.replace(tmp_path, cache_path)
+    except OSError as exc:
+        log.debug('Unable to cache default browser: %s', exc)
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+    return default
 
 
 def set_default_browser(desktop_entry):
@@ -91,6 +179,9 @@ def set_default_browser(desktop_entry):
         return True
     except Exception:  # pylint: disable=broad-except
         log.exception('Unable to set default browser with cmd %r:', cmd)
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(_default_browser_cache_path())
     return False
 
 
@@ -102,6 +193,17 @@ def which(prog, raise_exception=False):
     return True
 
 
+def _ensure_parent_dir(file_name):
+    # Ensure that `file_name`'s parent directory exists
+    dir_name = os.path.dirname(file_name)
+    if not os.path.isdir(dir_name):
+        log.debug('Creating dirs: %s', dir_name)
+        os.makedirs(dir_name)
+    else:
+        log.debug('File dir: %s', dir_name)
+    return file_name
+
+
 def get_data_file_path(filename):
     """Returns the full path to the *data file* indicated by `filename`.
 
@@ -113,16 +215,293 @@ def get_data_file_path(filename):
         /home/myuser/.local/share/uroute/foo.bar
 
     """
-    data_file_name = os.path.join(
+    return _ensure_parent_dir(os.path.join(
         xdg.BaseDirectory.xdg_data_home, 'uroute', filename,
+    ))
+
+
+def get_cache_file_path(filename):
+    """Returns the full path to the *cache file* indicated by `filename`.
+
+    Parent directories will be created where they are missing.
+
+    On Ubuntu, it will act like this:
+
+        >>> get_cache_file_path('foo.bar')
+        /home/myuser/.cache/uroute/foo.bar
+
+    """
+    return _ensure_parent_dir(os.path.join(
+        xdg.BaseDirectory.xdg_cache_home, 'uroute', filename,
+    ))
+
+
+def get_runtime_file_path(filename):
+    """Returns the full path to the *runtime file* indicated by `filename`.
+
+    Falls back to a private directory in ``/tmp`` if ``$XDG_RUNTIME_DIR`` is
+    not set.
+
+    On Ubuntu, it will act like this:
+
+        >>> get_runtime_file_path('foo.sock')
+        /run/user/1000/uroute/foo.sock
+
+    """
+    return _ensure_parent_dir(os.path.join(
+        xdg.BaseDirectory.get_runtime_dir(strict=False), 'uroute', filename,
+    ))
+
+
+def _read_desktop_groups(path):
+    # A minimal desktop entry parser: unlike `DesktopEntry`, it skips
+    # localized keys and doesn't validate, which makes scanning cheap.
+    groups = {}
+    group = None
+    with open(path, encoding='UTF-8', errors='replace') as desktop_file:
+        for line in desktop_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                group = groups.setdefault(line[1:-1], {})
+            elif group is not None and '=' in line:
+                key, value = line.split('=', 1)
+                key = key.strip()
+                if '[' not in key:
+                    group.setdefault(key, value.strip())
+    return groups
+
+
+def exec_to_command(exec_value):
+    """Converts a desktop entry ``Exec`` value to a Uroute command.
+
+    URL and file field codes are replaced by ``@URL``, and other field
+    codes are removed. Returns `None` for invalid values.
+    """
+    try:
+        args = shlex.split(exec_value)
+    except ValueError:
+        return None
+
+    command = []
+    for arg in args:
+        if arg in URL_FIELD_CODES:
+            arg = '@URL'
+        elif len(arg) == 2 and arg[0] == '%' and arg[1].isalpha():
+            continue  # Drop other field codes, like %i and %c
+        command.append(arg.replace('%%', '%'))
+    return ' '.join(shlex.quote(arg) for arg in command) or None
+
+
+def parse_browser_entry(path, desktop_id):
+    """Parses the desktop entry in `path`, and returns it as a
+    `BrowserEntry`.
+
+    Returns `None` if the entry is not a visible web browser, or can't be
+    read.
+    """
+    try:
+        groups = _read_desktop_groups(path)
+    except OSError as exc:
+        log.debug('Unable to read desktop entry %s: %s', path, exc)
+        return None
+
+    entry = groups.get('Desktop Entry', {})
+    categories = entry.get('Categories', '').split(';')
+    mime_types = entry.get('MimeType', '').split(';')
+    if entry.get('Type') != 'Application' \
+            or entry.get('Hidden') == 'true' \
+            or entry.get('NoDisplay') == 'true' \
+            or not ('WebBrowser' in categories
+                    or BROWSER_MIME_TYPE in mime_types):
+        return None
+
+    command = exec_to_command(entry.get('Exec', ''))
+    if not command or 'Name' not in entry:
+        return None
+
+    actions = []
+    for action_id in filter(None, entry.get('Actions', '').split(';')):
+        action = groups.get(f'Desktop Action {action_id}', {})
+        action_command = exec_to_command(action.get('Exec', ''))
+        if action_command and 'Name' in action:
+            actions.append(DesktopAction(
+                action_id=action_id,
+                name=action['Name'],
+                command=action_command,
+                icon=action.get('Icon', entry.get('Icon')),
+            ))
+
+    return BrowserEntry(
+        desktop_id=desktop_id,
+        name=entry['Name'],
+        command=command,
+        icon=entry.get('Icon'),
+        actions=tuple(actions),
+        path=path,
     )
 
-    # Ensure that `data_file_name`'s parent directory exists
-    dir_name = os.path.dirname(data_file_name)
-    if not os.path.isdir(dir_name):
-        log.debug('Creating dirs: %s', dir_name)
-        os.makedirs(dir_name)
-    else:
-        log.debug('Data file dir: %s', dir_name)
 
-    return data_file_name
+class DesktopEntryIndex:
+    """An index of the web browsers in the desktop entries of the
+    ``applications`` sub-directory of each XDG data directory.
+
+    :meth:`scan` only lists directories of which the mtime changed since
+    the previous scan, and only parses the desktop entries in them that
+    are new or have changed. The index can be saved and loaded, so that
+    this carries over between Uroute runs.
+    """
+
+    def __init__(self, data_dirs=None):
+        if data_dirs is None:
+            data_dirs = xdg.BaseDirectory.xdg_data_dirs
+        self.app_dirs = [
+            os.path.join(data_dir, 'applications') for data_dir in data_dirs
+        ]
+        self.modified = False
+        # Directory path => (mtime, sub-dir names, {file name: entry})
+        # where entry is a ``(mtime, BrowserEntry or None)`` pair
+        self._dirs = {}
+
+    def load(self, path):
+        """Loads an index saved to `path` by :meth:`save`."""
+        dirs = load_pickle(path, (VERSION, self.app_dirs))
+        if dirs is None:
+            return
+        self._dirs = dirs
+        log.debug('Loaded %d indexed directories from %r', len(dirs), path)
+
+    def save(self, path):
+        """Atomically saves the index to `path`, if modified."""
+        if self.modified and save_pickle_atomic(
+                path, (VERSION, self.app_dirs), self._dirs):
+            self.modified = False
+
+    def _list_dir(self, dir_path, mtime, to_parse):
+        old_files = self._dirs.get(dir_path, (None, (), {}))[2]
+        subdirs = []
+        files = {}
+        try:
+            with os.scandir(dir_path) as dir_entries:
+                for dir_entry in dir_entries:
+                    if dir_entry.is_dir():
+                        subdirs.append(dir_entry.name)
+                    elif dir_entry.name.endswith('.desktop'):
+                        file_mtime = dir_entry.stat().st_mtime_ns
+                        old = old_files.get(dir_entry.name)
+                        if old is not None and old[0] == file_mtime:
+                            files[dir_entry.name] = old
+                        else:
+                            files[dir_entry.name] = (file_mtime, None)
+                            to_parse.append((dir_path, dir_entry.name))
+        except OSError as exc:
+            log.debug('Unable to list %s: %s', dir_path, exc)
+        return mtime, sorted(subdirs), files
+
+    def scan(self, max_workers=8):
+        """Updates the index from the desktop entry directories.
+
+        Changed desktop entries are parsed in parallel, by up to
+        `max_workers` threads.
+        """
+        dirs = {}
+        to_parse = []
+        pending = list(self.app_dirs)
+        while pending:
+            dir_path = pending.pop()
+            mtime = mtime_ns(dir_path)
+            if mtime is None:
+                continue
+            cached = self._dirs.get(dir_path)
+            if cached is None or cached[0] != mtime:
+                cached = self._list_dir(dir_path, mtime, to_parse)
+                self.modified = True
+            dirs[dir_path] = cached
+            pending.extend(
+                os.path.join(dir_path, subdir) for subdir in cached[1]
+            )
+        if dirs.keys() != self._dirs.keys():
+            self.modified = True
+
+        if to_parse:
+            def parse(item):
+                dir_path, file_name = item
+                path = os.path.join(dir_path, file_name)
+                return parse_browser_entry(
+                    path, self._desktop_id(dir_path, file_name),
+                )
+
+            with ThreadPoolExecutor(
+                    max_workers=min(max_workers, len(to_parse))) as pool:
+                for (dir_path, file_name), entry in zip(
+                        to_parse, pool.map(parse, to_parse)):
+                    files = dirs[dir_path][2]
+                    files[file_name] = (files[file_name][0], entry)
+            log.debug('Parsed %d desktop entries', len(to_parse))
+
+        self._dirs = dirs
+
+    def _desktop_id(self, dir_path, file_name):
+        for app_dir in self.app_dirs:
+            if dir_path == app_dir \
+                    or dir_path.startswith(app_dir + os.sep):
+                rel_path = os.path.relpath(
+                    os.path.join(dir_path, file_name), app_dir,
+                )
+                return rel_path.replace(os.sep, '-')
+        return file_name
+
+    def browsers(self):
+        """Returns the indexed `BrowserEntry` objects, sorted by name.
+
+        Like desktop entries themselves, entries in earlier data
+        directories hide the ones with the same desktop ID in later
+        directories.
+        """
+        seen = set()
+        browsers = []
+        for app_dir in self.app_dirs:
+            pending = [app_dir]
+            while pending:
+                dir_path = pending.pop()
+                if dir_path not in self._dirs:
+                    continue
+                _mtime_ns, subdirs, files = self._dirs[dir_path]
+                for file_name, (_mtime_ns, entry) in sorted(files.items()):
+                    desktop_id = self._desktop_id(dir_path, file_name)
+                    if desktop_id in seen:
+                        continue
+                    seen.add(desktop_id)
+                    if entry is not None and desktop_id != 'uroute.desktop':
+                        browsers.append(entry)
+                pending.extend(
+                    os.path.join(dir_path, subdir) for subdir in subdirs
+                )
+        return sorted(browsers, key=lambda entry: entry.name.lower())
+
+
+def find_browsers():
+    """Scans for installed web browsers, using and updating the desktop
+    entry index in the XDG cache dir.
+
+    Returns a list of `BrowserEntry` objects.
+    """
+    index = DesktopEntryIndex()
+    index_file = get_cache_file_path('desktop-entries.cache')
+    index.load(index_file)
+    index.scan()
+    index.save(index_file)
+    return index.browsers()
+
+
+def get_icon_path(icon, size=64):
+    """Returns the path to the file of `icon`, which may be an icon theme
+    name or a path, or `None` if it can't be found.
+    """
+    if not icon:
+        return None
+    if os.path.isabs(icon):
+        return icon if os.path.isfile(icon) else None
+    from xdg import IconTheme  # pylint: disable=import-outside-toplevel
+    return IconTheme.getIconPath(icon, size)